@@ -0,0 +1,11 @@
+import pytest
+
+from yatube.testing import TestEnvironment
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_environment():
+    environment = TestEnvironment()
+    environment.enable()
+    yield
+    environment.disable()
@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 
+from . import search
 from .models import Post, Group
 
 
@@ -9,6 +11,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE '%...%' по text
+        if not search.to_match(search_term):
+            return queryset, False
+        return queryset.filter(
+            id__in=RawSQL(*search.match_ids(search_term))), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
@@ -0,0 +1,370 @@
+import base64
+import binascii
+import hashlib
+import json
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.core.files.storage import default_storage
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+from .models import Comment, Follow, Group, Post, User
+from .paginator import CursorPaginator, decode_cursor, encode_cursor
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Ответ отдается кусками не меньше этого размера
+CHUNK_SIZE = 16 * 1024
+
+# Кодировщик на C: каждая запись кодируется целиком, а поток собирается
+# из готовых кусков, поэтому медленный чистый iterencode не нужен
+_encode = json.JSONEncoder(
+    ensure_ascii=False, check_circular=False, separators=(",", ":")).encode
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Field:
+    """Поле ресурса: колонки выборки и функция, собирающая из них
+    значение. Без функции значение - первая колонка"""
+
+    def __init__(self, *columns, convert=None):
+        self.columns = columns
+        self.convert = convert
+
+    def value(self, row):
+        values = [row[column] for column in self.columns]
+        if self.convert is None:
+            return values[0]
+        return self.convert(*values)
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+def _full_name(first_name, last_name):
+    return f"{first_name} {last_name}".strip()
+
+
+class Resource:
+    """Ресурс API поверх модели. Выборка идет через values() только
+    нужных fields= колонок, без создания объектов моделей. includes -
+    связанные ресурсы: имя в include= -> (колонка с их id, ресурс)"""
+
+    def __init__(self, type, queryset, fields, includes=None):
+        self.type = type
+        self.queryset = queryset
+        self.fields = fields
+        self.includes = includes or {}
+
+    def field_names(self, names):
+        """Поля из fields=: пусто - все. Неизвестное поле - ошибка"""
+        if not names:
+            return list(self.fields)
+        names = names.split(",")
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(
+                f"Неизвестные поля {self.type}: {', '.join(unknown)}")
+        return names
+
+    def columns(self, names, includes=(), extra=()):
+        columns = {"id", *extra}
+        for name in names:
+            columns.update(self.fields[name].columns)
+        columns.update(self.includes[name][0] for name in includes)
+        return columns
+
+    def rows(self, queryset, names, includes=(), extra=()):
+        return queryset.values(*self.columns(names, includes, extra))
+
+    def serialize(self, row, names):
+        data = {"id": row["id"]}
+        for name in names:
+            data[name] = self.fields[name].value(row)
+        return data
+
+
+USERS = Resource("users", User.objects.all(), {
+    "username": Field("username"),
+    "full_name": Field("first_name", "last_name", convert=_full_name),
+    "posts_count": Field("stats__posts_count"),
+    "followers_count": Field("stats__followers_count"),
+    "following_count": Field("stats__following_count"),
+})
+
+GROUPS = Resource("groups", Group.objects.all(), {
+    "title": Field("title"),
+    "slug": Field("slug"),
+    "description": Field("description"),
+})
+
+POSTS = Resource("posts", Post.objects.all(), {
+    "text": Field("text"),
+    "pub_date": Field("pub_date", convert=_isoformat),
+    "author": Field("author__username"),
+    "group": Field("group__slug"),
+    "image": Field("image", convert=_media_url),
+    "comment_count": Field("comment_count"),
+    "version": Field("version"),
+}, includes={"author": ("author_id", USERS), "group": ("group_id", GROUPS)})
+
+COMMENTS = Resource("comments", Comment.objects.all(), {
+    "text": Field("text"),
+    "created": Field("created", convert=_isoformat),
+    "author": Field("author__username"),
+    "post": Field("post_id"),
+    "parent": Field("parent_id"),
+    "depth": Field("depth"),
+    "reply_count": Field("reply_count"),
+}, includes={"author": ("author_id", USERS)})
+
+FOLLOWS = Resource("follows", Follow.objects.all(), {
+    "user": Field("user__username"),
+    "author": Field("author__username"),
+}, includes={"user": ("user_id", USERS), "author": ("author_id", USERS)})
+
+
+class RowPaginator(CursorPaginator):
+    """Курсорный паджинатор по строкам values(). Для ключа по id курсор -
+    сам id"""
+
+    def key_for(self, row):
+        return row[self.field], row[self.tiebreaker]
+
+    def encode_cursor(self, value, pk):
+        if self.field == self.tiebreaker:
+            return base64.urlsafe_b64encode(
+                str(pk).encode()).decode().rstrip("=")
+        return encode_cursor(value, pk)
+
+    def decode_cursor(self, token):
+        if self.field != self.tiebreaker:
+            return decode_cursor(token)
+        if not token:
+            return None
+        try:
+            pk = int(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        except (binascii.Error, ValueError):
+            return None
+        return pk, pk
+
+
+class Query:
+    """Параметры запроса к ресурсу: поля основного и включенных
+    ресурсов (fields=, fields[users]=) и включения (include=)"""
+
+    def __init__(self, request, resource):
+        self.request = request
+        self.resource = resource
+        self.fields = resource.field_names(request.GET.get("fields"))
+        self.includes = [
+            name for name in request.GET.get("include", "").split(",") if name]
+        unknown = [
+            name for name in self.includes if name not in resource.includes]
+        if unknown:
+            raise ApiError(f"Неизвестные включения: {', '.join(unknown)}")
+
+    def rows(self, queryset, *extra):
+        """Выборка колонок полей и включений, extra - еще колонки,
+        например ключ паджинатора"""
+        return self.resource.rows(
+            queryset, self.fields, self.includes, extra)
+
+    def serialize(self, rows):
+        return [self.resource.serialize(row, self.fields) for row in rows]
+
+    def included(self, rows):
+        """Связанные объекты страницы: по одному запросу на ресурс,
+        сколько бы строк на странице ни было"""
+        ids = {}
+        for name in self.includes:
+            column, resource = self.resource.includes[name]
+            ids.setdefault(resource, set()).update(
+                row[column] for row in rows if row[column] is not None)
+        included = {}
+        for resource, pks in ids.items():
+            names = resource.field_names(
+                self.request.GET.get(f"fields[{resource.type}]"))
+            included[resource.type] = [
+                resource.serialize(row, names) for row in resource.rows(
+                    resource.queryset.filter(pk__in=pks).order_by("pk"),
+                    names,
+                )
+            ]
+        return included
+
+
+def _page_size(request):
+    limit = request.GET.get("limit", "")
+    if not limit:
+        return PAGE_SIZE
+    if not limit.isdigit() or not 0 < int(limit) <= MAX_PAGE_SIZE:
+        raise ApiError(f"limit - число от 1 до {MAX_PAGE_SIZE}")
+    return int(limit)
+
+
+def _link(request, name, cursor):
+    if cursor is None:
+        return None
+    params = {
+        key: value for key, value in request.GET.items()
+        if key not in ("after", "before")
+    }
+    params[name] = cursor
+    return f"{request.path}?{urlencode(params)}"
+
+
+def _chunks(document):
+    """Кодирует документ {"data": [...], ...} кусками: записи data
+    кодируются по одной и собираются в куски по CHUNK_SIZE"""
+    data = document.pop("data")
+    if not isinstance(data, list):
+        yield _encode(dict(data=data, **document))
+        return
+    buffer, size = ['{"data":['], 0
+    for index, item in enumerate(data):
+        encoded = _encode(item)
+        buffer.append("," + encoded if index else encoded)
+        size += len(encoded)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    buffer.append("]")
+    for key, value in document.items():
+        buffer.append(f",{_encode(key)}:{_encode(value)}")
+    buffer.append("}")
+    yield "".join(buffer)
+
+
+def _respond(request, document):
+    """Потоковый JSON-ответ с ETag по содержимому документа. На
+    совпавший If-None-Match отвечает 304, не кодируя документ"""
+    raw = repr(sorted(document.items())).encode()
+    etag = f'"{hashlib.md5(raw).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = StreamingHttpResponse(
+            (chunk.encode() for chunk in _chunks(document)),
+            content_type="application/json",
+        )
+    response["ETag"] = etag
+    # Ответ не зависит от пользователя, но браузер перепроверяет его
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def api_view(view):
+    """Только чтение, ошибки - в JSON"""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            document = view(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse({"error": str(error)}, status=error.status)
+        except Http404:
+            return JsonResponse({"error": "Не найдено"}, status=404)
+        return _respond(request, document)
+    return wrapper
+
+
+def _list(request, resource, queryset, field="id"):
+    """Документ страницы ресурса по курсорам ?after=/?before= и
+    связанные объекты из include="""
+    query = Query(request, resource)
+    paginator = RowPaginator(
+        query.rows(queryset.order_by(f"-{field}", "-id"), field),
+        _page_size(request),
+        field=field, tiebreaker="id",
+    )
+    page = paginator.get_page(
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
+    rows = page.object_list
+    return {
+        "data": query.serialize(rows),
+        "included": query.included(rows),
+        "links": {
+            "next": _link(request, "after", page.next_cursor),
+            "previous": _link(request, "before", page.previous_cursor),
+        },
+    }
+
+
+def _detail(request, resource, queryset):
+    query = Query(request, resource)
+    rows = list(query.rows(queryset)[:1])
+    if not rows:
+        raise Http404
+    return {
+        "data": query.serialize(rows)[0],
+        "included": query.included(rows),
+    }
+
+
+@api_view
+def posts(request):
+    """Посты по убыванию даты, с фильтрами ?group=slug и
+    ?author=username"""
+    queryset = Post.objects.all()
+    if request.GET.get("group"):
+        queryset = queryset.filter(group__slug=request.GET["group"])
+    if request.GET.get("author"):
+        queryset = queryset.filter(author__username=request.GET["author"])
+    return _list(request, POSTS, queryset, field="pub_date")
+
+
+@api_view
+def post(request, post_id: int):
+    return _detail(request, POSTS, Post.objects.filter(id=post_id))
+
+
+@api_view
+def post_comments(request, post_id: int):
+    """Все комментарии поста по убыванию даты; ветки собираются по
+    parent"""
+    post = get_object_or_404(Post.objects.only("id"), id=post_id)
+    return _list(request, COMMENTS, post.comments.all(), field="created")
+
+
+@api_view
+def groups(request):
+    return _list(request, GROUPS, Group.objects.all())
+
+
+@api_view
+def group(request, slug: str):
+    return _detail(request, GROUPS, Group.objects.filter(slug=slug))
+
+
+@api_view
+def user(request, username: str):
+    return _detail(request, USERS, User.objects.filter(username=username))
+
+
+@api_view
+def following(request, username: str):
+    """Подписки пользователя, новые первыми"""
+    author = get_object_or_404(User.objects.only("id"), username=username)
+    return _list(request, FOLLOWS, Follow.objects.filter(user=author))
+
+
+@api_view
+def followers(request, username: str):
+    """Подписчики пользователя, новые первыми"""
+    author = get_object_or_404(User.objects.only("id"), username=username)
+    return _list(request, FOLLOWS, Follow.objects.filter(author=author))
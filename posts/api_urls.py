@@ -0,0 +1,19 @@
+from django.urls import path
+
+from . import api
+
+app_name = "api"
+
+urlpatterns = [
+    path("posts/", api.posts, name="posts"),
+    path("posts/<int:post_id>/", api.post, name="post"),
+    path("posts/<int:post_id>/comments/", api.post_comments,
+         name="post_comments"),
+    path("groups/", api.groups, name="groups"),
+    path("groups/<slug:slug>/", api.group, name="group"),
+    path("users/<str:username>/", api.user, name="user"),
+    path("users/<str:username>/following/", api.following,
+         name="following"),
+    path("users/<str:username>/followers/", api.followers,
+         name="followers"),
+]
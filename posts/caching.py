@@ -0,0 +1,315 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from yatube.cache import LocalCache
+
+# Кэш в памяти процесса перед общим кэшем. Фрагменты лежат под
+# неизменяемыми ключами и вытесняются только по размеру, счетчики
+# поколений сбрасываются при смене эпохи, см. sync_local_cache
+_local_fragments = LocalCache(settings.LOCAL_CACHE_MAX_SIZE)
+_local_generations = LocalCache(settings.LOCAL_CACHE_MAX_SIZE)
+_local_epoch = None
+
+EPOCH_KEY = "local_cache:epoch"
+
+
+def _generation_key(name):
+    return f"generation:{name}"
+
+
+def _initial_generation():
+    # Счетчик может быть вытеснен из кэша. Начинаем его со времени в мс,
+    # чтобы новый счетчик не совпал со старым значением и не оживил
+    # страницы, закэшированные под ним
+    return int(time.time() * 1000)
+
+
+def _incr_or_add(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_generation(), None)
+
+
+def sync_local_cache():
+    """Сверяет эпоху локального кэша с общей и при расхождении сбрасывает
+    закэшированные в процессе счетчики поколений. Вызывается один раз
+    на запрос из LocalCacheMiddleware"""
+    global _local_epoch
+    epoch = cache.get(EPOCH_KEY)
+    if epoch is None or epoch != _local_epoch:
+        _local_generations.clear()
+        _local_epoch = epoch
+
+
+def clear_local_cache():
+    global _local_epoch
+    _local_fragments.clear()
+    _local_generations.clear()
+    _local_epoch = None
+
+
+def get_generations(names):
+    """Текущие значения счетчиков поколений"""
+    keys = [_generation_key(name) for name in names]
+    values = _local_generations.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = cache.get_many(missing)
+        for key in missing:
+            if key not in found:
+                cache.add(key, _initial_generation(), None)
+                found[key] = cache.get(key)
+        _local_generations.set_many(found)
+        values.update(found)
+    return [values[key] for key in keys]
+
+
+def bump_generations(*names):
+    """Увеличивает счетчики поколений: все страницы, закэшированные под
+    старыми значениями, больше не будут отданы. Другие процессы узнают
+    об этом по эпохе, которая увеличивается после счетчиков"""
+    keys = [_generation_key(name) for name in set(names)]
+    for key in keys:
+        _incr_or_add(key)
+    _local_generations.delete_many(keys)
+    if keys:
+        _incr_or_add(EPOCH_KEY)
+
+
+def post_generations(username, slug=None):
+    """Счетчики страниц, на которых показывается пост автора в группе"""
+    names = ["index", f"author:{username}"]
+    if slug:
+        names.append(f"group:{slug}")
+    return names
+
+
+STATS_EVENTS = ("local", "hit", "miss", "stale", "early", "lock_wait")
+
+# Счетчики копятся в процессе и пишутся в общий кэш раз в запрос
+_pending_stats = Counter()
+_pending_lock = threading.Lock()
+
+
+def _stats_key(event):
+    return f"cache_stats:{event}"
+
+
+def record(event, count=1):
+    """Увеличивает счетчик событий кэша, см. cache_stats"""
+    with _pending_lock:
+        _pending_stats[event] += count
+
+
+def flush_stats():
+    """Переносит накопленные в процессе счетчики в общий кэш"""
+    with _pending_lock:
+        pending = _pending_stats.copy()
+        _pending_stats.clear()
+    for event, count in pending.items():
+        key = _stats_key(event)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, None):
+                cache.incr(key, count)
+
+
+def cache_stats():
+    """Счетчики попаданий в локальный и общий кэш, промахов, устаревших
+    отдач, досрочных пересчетов и ожиданий блокировки"""
+    flush_stats()
+    values = cache.get_many([_stats_key(event) for event in STATS_EVENTS])
+    return {
+        event: values.get(_stats_key(event), 0) for event in STATS_EVENTS
+    }
+
+
+def reset_cache_stats():
+    flush_stats()
+    cache.delete_many([_stats_key(event) for event in STATS_EVENTS])
+
+
+def _wrap(value, timeout, delta):
+    # Значение хранится вместе со сроком свежести и временем расчета:
+    # запись живет в кэше дольше срока свежести, чтобы ее можно было
+    # отдать устаревшей, пока другой процесс пересчитывает
+    return value, time.time() + timeout, delta
+
+
+def _is_fresh(expires, delta):
+    # Вероятностный досрочный пересчет (XFetch): чем ближе срок и чем
+    # дольше расчет, тем вероятнее пересчитать значение заранее
+    beta = settings.CACHE_EARLY_RECOMPUTE_BETA
+    gap = -delta * beta * math.log(1 - random.random())
+    return time.time() + gap < expires
+
+
+def _compute(key, compute, timeout):
+    started = time.time()
+    value = compute()
+    if value is not None:
+        cache.set(
+            key,
+            _wrap(value, timeout, time.time() - started),
+            timeout + settings.CACHE_STALE_TIMEOUT,
+        )
+    return value
+
+
+def _lock(key):
+    """Блокировка пересчета: cache.add атомарен во всех бэкендах Django"""
+    return cache.add(f"lock:{key}", 1, settings.CACHE_LOCK_TIMEOUT)
+
+
+def _unlock(key):
+    cache.delete(f"lock:{key}")
+
+
+def get_or_compute(key, compute, timeout):
+    """Возвращает значение из кэша или считает его через compute().
+
+    Пересчет выполняет один процесс, взявший блокировку в кэше. Остальные
+    в это время получают устаревшее значение, а если его нет - ждут
+    результат до CACHE_LOCK_WAIT секунд. None из compute() не кэшируется."""
+    envelope = cache.get(key)
+    if envelope is not None:
+        value, expires, delta = envelope
+        if _is_fresh(expires, delta):
+            record("hit")
+            return value
+        if not _lock(key):
+            record("stale")
+            return value
+        record("early" if time.time() < expires else "stale")
+        try:
+            return _compute(key, compute, timeout)
+        finally:
+            _unlock(key)
+    record("miss")
+    deadline = time.time() + settings.CACHE_LOCK_WAIT
+    while not _lock(key):
+        if time.time() >= deadline:
+            return compute()
+        record("lock_wait")
+        time.sleep(0.05)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope[0]
+    try:
+        return _compute(key, compute, timeout)
+    finally:
+        _unlock(key)
+
+
+def _get_local_fragments(keys):
+    result = {}
+    for key, envelope in _local_fragments.get_many(keys).items():
+        value, expires, delta = envelope
+        if _is_fresh(expires, delta):
+            result[key] = value
+    return result
+
+
+def get_many_or_compute(computes, timeout):
+    """Пакетный вариант get_or_compute для фрагментов: computes - словарь
+    ключ -> функция расчета. Свежие фрагменты сначала ищутся в памяти
+    процесса, затем в общем кэше. Отсутствующие считаются сразу (они
+    дешевые), устаревшие пересчитывает только взявший блокировку"""
+    result = _get_local_fragments(computes)
+    events = Counter(local=len(result))
+    envelopes = cache.get_many(
+        [key for key in computes if key not in result])
+    fresh = {}
+    local = {}
+    locked = []
+    for key, compute in computes.items():
+        if key in result:
+            continue
+        envelope = envelopes.get(key)
+        if envelope is not None:
+            value, expires, delta = envelope
+            if _is_fresh(expires, delta):
+                events["hit"] += 1
+                result[key] = value
+                local[key] = envelope
+                continue
+            if not _lock(key):
+                events["stale"] += 1
+                result[key] = value
+                continue
+            locked.append(f"lock:{key}")
+            events["early" if time.time() < expires else "stale"] += 1
+        else:
+            events["miss"] += 1
+        started = time.time()
+        result[key] = compute()
+        fresh[key] = _wrap(result[key], timeout, time.time() - started)
+    if fresh:
+        cache.set_many(fresh, timeout + settings.CACHE_STALE_TIMEOUT)
+    if locked:
+        cache.delete_many(locked)
+    _local_fragments.set_many({**local, **fresh})
+    for event, count in events.items():
+        record(event, count)
+    return result
+
+
+# Заголовки, которые view выставляет сами и которые хранятся со страницей
+PAGE_HEADERS = (
+    "Content-Type", "Cache-Control", "Surrogate-Key", "X-Next-Cursor")
+
+
+def page_key(request, generations):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"page:{path}:{'.'.join(map(str, generations))}"
+
+
+def cache_anonymous_page(*generations):
+    """Кэширует страницу для анонимных пользователей под счетчиками
+    поколений. Имена счетчиков форматируются аргументами view, например
+    "group:{slug}". Записи увеличивают счетчики, поэтому устаревшая
+    страница не отдается и срок жизни может быть долгим"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET" or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            names = [name.format(**kwargs) for name in generations]
+            key = page_key(request, get_generations(names))
+            response = None
+
+            def render_page():
+                nonlocal response
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.cookies:
+                    return response.content, {
+                        name: response[name] for name in PAGE_HEADERS
+                        if response.has_header(name)
+                    }
+                return None
+
+            cached = get_or_compute(
+                key, render_page, settings.PAGE_CACHE_TIMEOUT)
+            if response is not None:
+                return response
+            if cached is None:
+                return view(request, *args, **kwargs)
+            content, headers = cached
+            response = HttpResponse(content)
+            for name, value in headers.items():
+                response[name] = value
+            return response
+        wrapper.page_generations = generations
+        return wrapper
+    return decorator
@@ -0,0 +1,52 @@
+import re
+from functools import partial
+
+from django.conf import settings
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .caching import get_many_or_compute
+
+# Участки карточки, которые видны не всем: <!--if:flag-->...<!--/if:flag-->
+VIEWER_BLOCK = re.compile(r"<!--if:(\w+)-->(.*?)<!--/if:\1-->", re.S)
+
+
+def card_key(post):
+    # pub_date в ключе защищает от повторно выданных id
+    return (
+        f"post_card:{post.pk}:{post.version}:"
+        f"{post.pub_date.timestamp()}"
+    )
+
+
+def bump_versions(posts):
+    """Сбрасывает закэшированные карточки постов из queryset"""
+    posts.update(version=F("version") + 1)
+
+
+def personalize(html, post, user):
+    """Оставляет в карточке только кнопки, доступные зрителю"""
+    flags = {
+        "auth": user.is_authenticated,
+        "author": user.is_authenticated and user.pk == post.author_id,
+    }
+    return VIEWER_BLOCK.sub(
+        lambda match: match.group(2) if flags[match.group(1)] else "",
+        html,
+    )
+
+
+def render_cards(posts, user):
+    """Возвращает HTML карточек постов. Готовые карточки берутся из кэша
+    одним get_many, недостающие рендерятся и кладутся одним set_many"""
+    computes = {
+        card_key(post): partial(
+            render_to_string, "posts/post_item.html", {"post": post})
+        for post in posts
+    }
+    cached = get_many_or_compute(
+        computes, settings.POST_CARD_CACHE_TIMEOUT)
+    return mark_safe("".join(
+        personalize(cached[card_key(post)], post, user) for post in posts
+    ))
@@ -0,0 +1,101 @@
+import hashlib
+
+from django.conf import settings
+from django.views.decorators.http import condition
+
+from .caching import get_generations, get_or_compute, page_key
+from .models import Follow, Group, Post, User
+from .paginator import get_cursor_page
+from .stats import get_stats
+
+
+def _feed_state(request, posts, per_page):
+    """Состояние страницы ленты: id и версии постов на ней (версия
+    растет при правке поста и при каждом комментарии) и курсоры соседних
+    страниц. Выборка та же, что у view, но без рендеринга карточек"""
+    page = get_cursor_page(
+        request, posts.only("pub_date", "version"), per_page)
+    return [[(post.pk, post.version) for post in page],
+            page.next_cursor, page.previous_cursor]
+
+
+def _author_parts(author):
+    stats = get_stats(author)
+    return [author.username, author.get_full_name(), stats.posts_count,
+            stats.followers_count, stats.following_count]
+
+
+def index_state(request):
+    return _feed_state(request, Post.objects.all(), 10)
+
+
+def group_state(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return None
+    parts = _feed_state(request, Post.objects.filter(group_id=group.pk), 10)
+    return [group.title, group.description, parts]
+
+
+def profile_state(request, username):
+    author = User.objects.select_related("stats").filter(
+        username=username).first()
+    if author is None:
+        return None
+    following = (
+        request.user.is_authenticated and Follow.objects.filter(
+            user=request.user, author=author).exists()
+    )
+    parts = _feed_state(request, Post.objects.filter(author_id=author.pk), 5)
+    return [_author_parts(author), following, parts]
+
+
+def post_state(request, username, post_id, **kwargs):
+    # Фрагменты страницы поста (comment_id и т.п.) меняются вместе с ним
+    post = Post.objects.select_related("author__stats").filter(
+        author__username=username, id=post_id).first()
+    if post is None:
+        return None
+    return [_author_parts(post.author), post.version]
+
+
+def conditional_page(state):
+    """Отвечает 304 на If-None-Match до вызова view.
+
+    state(request, **kwargs) дешево описывает содержимое страницы без
+    рендеринга: возвращает части ETag или None, если страницы нет. ETag
+    учитывает и зрителя: карточки и меню зависят от того, кто смотрит.
+    Last-Modified не отдается: дата поста или комментария не меняется
+    ни при правке, ни при смене зрителя, и If-Modified-Since получал бы
+    устаревший 304. Для гостей состояние страниц,
+    кэшируемых через cache_anonymous_page, само кэшируется под теми же
+    счетчиками поколений, так что проверка не ходит в базу"""
+    def decorator(view):
+        generations = getattr(view, "page_generations", None)
+
+        def get_state(request, **kwargs):
+            if not hasattr(request, "_page_state"):
+                request._page_state = _compute_state(request, kwargs)
+            return request._page_state
+
+        def _compute_state(request, kwargs):
+            if generations is None or request.user.is_authenticated:
+                return state(request, **kwargs)
+            names = [name.format(**kwargs) for name in generations]
+            key = "state:" + page_key(request, get_generations(names))
+            return get_or_compute(
+                key, lambda: state(request, **kwargs),
+                settings.PAGE_CACHE_TIMEOUT,
+            )
+
+        def etag(request, *args, **kwargs):
+            page_state = get_state(request, **kwargs)
+            if page_state is None:
+                return None
+            viewer = (request.user.username
+                      if request.user.is_authenticated else "")
+            raw = repr((viewer, page_state)).encode()
+            return hashlib.md5(raw).hexdigest()
+
+        return condition(etag_func=etag)(view)
+    return decorator
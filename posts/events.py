@@ -0,0 +1,211 @@
+import json
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.db.models import Max
+from django.urls import reverse
+
+from .models import Follow, Post
+
+# Сколько последних событий процесс держит в памяти для подписчиков
+BUFFER_SIZE = 1000
+
+Event = namedtuple("Event", "id author_id author group_id group")
+
+_FIELDS = ("id", "author_id", "author__username", "group_id", "group__slug")
+
+
+def _events(posts, after, limit):
+    rows = posts.filter(id__gt=after).order_by("id").values_list(*_FIELDS)
+    return [Event(*row) for row in rows[:limit]]
+
+
+class Subscription:
+    """Какие посты интересны подписчику: авторов из подписок или группы"""
+
+    def __init__(self, author_ids=None, group_id=None):
+        self.author_ids = author_ids
+        self.group_id = group_id
+
+    @classmethod
+    def follow(cls, user):
+        return cls(author_ids=set(Follow.objects.filter(
+            user=user).values_list("author_id", flat=True)))
+
+    def matches(self, event):
+        if self.group_id is not None:
+            return event.group_id == self.group_id
+        return event.author_id in self.author_ids
+
+    def posts(self):
+        if self.group_id is not None:
+            return Post.objects.filter(group_id=self.group_id)
+        return Post.objects.filter(author_id__in=self.author_ids)
+
+
+class Broker:
+    """Рассылка новых постов подписчикам процесса.
+
+    Журнал событий - сама таблица постов: id поста растет с каждой
+    записью и служит id события. Ожидающие подписчики не ходят в базу:
+    раз в EVENTS_POLL_INTERVAL секунд один из них забирает новые посты
+    одним запросом за всех, кладет их в общий буфер и будит остальных.
+    publish будит их сразу, поэтому посты своего процесса приходят без
+    задержки, а чужих - не позже следующего опроса"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._buffer = deque(maxlen=BUFFER_SIZE)
+        # В буфере все события с id в (_floor, _last_id]
+        self._floor = self._last_id = None
+        self._next_poll = 0.0
+        self._polling = False
+        self.connections = 0
+
+    def connect(self):
+        """Занимает место подписчика. False - мест в процессе нет"""
+        with self._condition:
+            if self.connections >= settings.EVENTS_MAX_CONNECTIONS:
+                return False
+            self.connections += 1
+            return True
+
+    def disconnect(self):
+        with self._condition:
+            self.connections -= 1
+
+    def publish(self, post):
+        """Сообщает о новом посте: ожидающие опрашивают базу сейчас же"""
+        with self._condition:
+            self._next_poll = 0.0
+            self._condition.notify_all()
+
+    def latest(self):
+        """id последнего известного события"""
+        while True:
+            self._poll()
+            with self._condition:
+                if self._last_id is not None:
+                    return self._last_id
+                # Первый опрос идет в другом потоке
+                self._condition.wait(1)
+
+    def _poll(self):
+        with self._condition:
+            if self._polling or (self._last_id is not None
+                                 and time.monotonic() < self._next_poll):
+                return
+            self._polling = True
+            last_id = self._last_id
+        events = []
+        try:
+            if last_id is None:
+                last_id = Post.objects.aggregate(last=Max("id"))["last"] or 0
+            else:
+                events = _events(Post.objects.all(), last_id, BUFFER_SIZE)
+        finally:
+            with self._condition:
+                self._polling = False
+                self._next_poll = (
+                    time.monotonic() + settings.EVENTS_POLL_INTERVAL)
+                if self._last_id is None:
+                    self._floor = self._last_id = last_id
+                for event in events:
+                    if len(self._buffer) == BUFFER_SIZE:
+                        self._floor = self._buffer[0].id
+                    self._buffer.append(event)
+                    self._last_id = event.id
+                if len(events) == BUFFER_SIZE:
+                    # Опрос не забрал всех, следующий - без паузы
+                    self._next_poll = 0.0
+                self._condition.notify_all()
+
+    def _replay(self, subscription, cursor):
+        # Подписчик отстал от буфера (переподключился с Last-Event-ID):
+        # события ему выбираются из базы. Клиенту достаточно знать, что
+        # новые посты есть, поэтому больше EVENTS_REPLAY не отдаем
+        with self._condition:
+            last_id = self._last_id
+        events = _events(
+            subscription.posts(), cursor, settings.EVENTS_REPLAY)
+        return [event for event in events if event.id <= last_id], last_id
+
+    def wait(self, subscription, cursor, timeout):
+        """Ждет до timeout секунд события после cursor. Возвращает
+        подходящие подписке события и новый курсор"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._poll()
+            with self._condition:
+                if cursor < self._floor:
+                    break
+                if self._last_id > cursor:
+                    events = [
+                        event for event in self._buffer if event.id > cursor]
+                    cursor = self._last_id
+                    events = [
+                        event for event in events
+                        if subscription.matches(event)
+                    ]
+                    if events:
+                        return events, cursor
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], cursor
+                self._condition.wait(min(
+                    remaining,
+                    max(self._next_poll - time.monotonic(), 0.01),
+                ))
+        return self._replay(subscription, cursor)
+
+
+broker = Broker()
+
+
+def publish(post):
+    broker.publish(post)
+
+
+def format_event(event):
+    data = json.dumps({
+        "id": event.id,
+        "author": event.author,
+        "group": event.group,
+        "url": reverse("post", args=[event.author, event.id]),
+    })
+    return f"id: {event.id}\nevent: post\ndata: {data}\n\n"
+
+
+def stream(broker, subscription, last_event_id=None):
+    """Поток событий text/event-stream о новых постах подписки.
+
+    Без событий раз в EVENTS_HEARTBEAT секунд уходит комментарий: он
+    держит соединение через прокси и сразу обнаруживает ушедшего
+    клиента. Вместе с ним передается id, до которого события уже
+    просмотрены, чтобы переподключение не перебирало чужие посты.
+    Через EVENTS_MAX_AGE секунд поток заканчивается, и браузер
+    переподключается с Last-Event-ID - так соединение не занимает поток
+    сервера вечно. Место подписчика занимается при первом чтении
+    генератора: finally незапущенного генератора не выполняется"""
+    if not broker.connect():
+        # Мест нет: EventSource переподключится позже сам, а на ответ
+        # с ошибкой он перестал бы переподключаться совсем
+        yield f"retry: {settings.EVENTS_BUSY_RETRY * 1000}\n\n"
+        return
+    try:
+        latest = broker.latest()
+        cursor = latest if last_event_id is None else min(
+            last_event_id, latest)
+        yield f"retry: {settings.EVENTS_RETRY * 1000}\n\n"
+        deadline = time.monotonic() + settings.EVENTS_MAX_AGE
+        while time.monotonic() < deadline:
+            events, cursor = broker.wait(
+                subscription, cursor, settings.EVENTS_HEARTBEAT)
+            if events:
+                yield "".join(format_event(event) for event in events)
+            else:
+                yield f": ping\nid: {cursor}\n\n"
+    finally:
+        broker.disconnect()
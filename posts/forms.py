@@ -1,9 +1,19 @@
 from django import forms
 
-from .models import Comment, Post
+from .models import Comment, Group, Post, User
 
 
 class PostForm(forms.ModelForm):
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Ошибки, найденные при приеме файлов, см. posts/uploads.py
+        self.upload_errors = upload_errors or {}
+
+    def clean_image(self):
+        if "image" in self.upload_errors:
+            raise forms.ValidationError(self.upload_errors["image"])
+        return self.cleaned_data["image"]
+
     class Meta:
         model = Post
         fields = ("group", "text", "image")
@@ -19,3 +29,21 @@ class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ("text",)
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label="Запрос", max_length=200, required=False)
+    group = forms.ModelChoiceField(
+        Group.objects.all(), to_field_name="slug", required=False,
+        label="Группа", empty_label="Все группы",
+    )
+    author = forms.CharField(label="Автор", max_length=150, required=False)
+
+    def clean_author(self):
+        username = self.cleaned_data["author"]
+        if not username:
+            return None
+        author = User.objects.filter(username=username).first()
+        if author is None:
+            raise forms.ValidationError("Нет такого автора")
+        return author
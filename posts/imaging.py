@@ -0,0 +1,48 @@
+"""Кодирование вариантов картинок постов.
+
+Модуль выполняется в пуле процессов (см. posts/thumbnails.py), поэтому
+зависит только от Pillow: ни настроек Django, ни базы здесь нет."""
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Расширения файлов для форматов Pillow
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+
+
+def crop_to_aspect(image, aspect):
+    """Обрезает картинку по центру до пропорции aspect = (ширина, высота)"""
+    width, height = image.size
+    ratio_width, ratio_height = aspect
+    if width * ratio_height > height * ratio_width:
+        new_width = height * ratio_width // ratio_height
+        left = (width - new_width) // 2
+        return image.crop((left, 0, left + new_width, height))
+    new_height = width * ratio_height // ratio_width
+    top = (height - new_height) // 2
+    return image.crop((0, top, width, top + new_height))
+
+
+def variant_widths(width, widths):
+    """Ширины вариантов: меньше исходной плюс сама исходная, если она
+    меньше самого широкого варианта. Картинки не увеличиваются"""
+    result = [value for value in widths if value < width]
+    result.append(min(width, max(widths)))
+    return sorted(set(result))
+
+
+def render_variants(data, widths, aspect, formats, quality):
+    """Возвращает список (ширина, высота, формат, байты) вариантов
+    картинки из data во всех ширинах и форматах"""
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+    image = crop_to_aspect(image, aspect)
+    variants = []
+    for width in variant_widths(image.width, widths):
+        height = max(1, round(width * image.height / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for image_format in formats:
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=quality)
+            variants.append((width, height, image_format, buffer.getvalue()))
+    return variants
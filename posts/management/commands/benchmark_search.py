@@ -0,0 +1,117 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+# Слова выбираются по закону Ципфа: первые часто, последние редко
+WORDS = (
+    "и в не на я что тот быть с он а весь это как она по но они к у ты "
+    "из мы за вы так же от сказать этот который мочь человек о один еще "
+    "бы такой только себя свое какой когда уже для вот кто да говорить "
+    "год знать мой до или если время рука нет самый ни стать большой "
+    "даже другой наш свой ну под где дело есть сам раз чтобы два там "
+    "чем глаз жизнь первый день тута ничто потом очень со хотеть ли при "
+    "голова надо без видеть идти теперь тоже стоять друг дом сейчас "
+    "можно после слово здесь думать место спросить через лицо что-то "
+    "кот собака окно шкаф лампа книга сад река город утро вечер ночь "
+    "зима весна лето осень дорога поезд море гора лес поле небо звезда"
+).split()
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает поиск постов через FTS5 с поиском LIKE '%...%' "
+            "на синтетических данных во временной базе")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--posts", type=int, default=1_000_000,
+            help="Сколько постов сгенерировать",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="Сколько раз повторять каждый запрос",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Начальное значение генератора текстов",
+        )
+
+    def generate(self, cursor, count, seed):
+        rng = random.Random(seed)
+        weights = [1 / rank for rank in range(1, len(WORDS) + 1)]
+        batch = []
+        for pk in range(1, count + 1):
+            words = rng.choices(WORDS, weights, k=rng.randint(5, 60))
+            batch.append((pk, " ".join(words)))
+            if len(batch) == 10_000:
+                cursor.executemany(
+                    "INSERT INTO posts_post VALUES (?, ?, NULL, 1)", batch)
+                batch = []
+        cursor.executemany(
+            "INSERT INTO posts_post VALUES (?, ?, NULL, 1)", batch)
+
+    def measure(self, cursor, sql, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cursor.execute(sql, params).fetchall()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "benchmark.sqlite3")
+            db = sqlite3.connect(path, isolation_level=None)
+            cursor = db.cursor()
+            cursor.execute(
+                "CREATE TABLE posts_post (id INTEGER PRIMARY KEY, "
+                "text TEXT, group_id INTEGER, author_id INTEGER)")
+            search.create_index(cursor)
+            started = time.perf_counter()
+            cursor.execute("BEGIN")
+            self.generate(cursor, options["posts"], options["seed"])
+            cursor.execute("COMMIT")
+            self.stdout.write(
+                f"Постов: {options['posts']}, вставка с индексацией: "
+                f"{time.perf_counter() - started:.1f} с, "
+                f"размер базы: {os.path.getsize(path) / 2 ** 20:.0f} МБ"
+            )
+            # Админка кроме страницы считает и число найденных постов
+            queries = {
+                "LIKE": (
+                    "SELECT id FROM posts_post WHERE text LIKE ? "
+                    "ORDER BY id DESC LIMIT 10",
+                    "SELECT COUNT(*) FROM posts_post WHERE text LIKE ?",
+                ),
+                "FTS5": (
+                    search.ranked_sql().replace("%s", "?"),
+                    f"SELECT COUNT(*) FROM {search.FTS_TABLE} "
+                    f"WHERE {search.FTS_TABLE} MATCH ?",
+                ),
+            }
+            self.stdout.write(
+                "Медиана, мс: первая страница / число найденных")
+            self.stdout.write(f"{'Запрос':<14}{'LIKE':>20}{'FTS5':>20}")
+            for query in ("и", "кот", "звезда", "лес поле", "звездочет"):
+                params = {
+                    "LIKE": [f"%{query}%"],
+                    "FTS5": [search.to_match(query)],
+                }
+                cells = []
+                for name, (page_sql, count_sql) in queries.items():
+                    page = self.measure(
+                        cursor, page_sql,
+                        params[name] + ([10] if name == "FTS5" else []),
+                        options["repeat"])
+                    count = self.measure(
+                        cursor, count_sql, params[name], options["repeat"])
+                    cells.append(f"{page:.1f} / {count:.1f}")
+                self.stdout.write(
+                    f"{query:<14}{cells[0]:>20}{cells[1]:>20}")
+            db.close()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Показывает счетчики попаданий и промахов кэша лент и карточек"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true",
+            help="Обнулить счетчики после вывода",
+        )
+
+    def handle(self, *args, **options):
+        for event, count in cache_stats().items():
+            self.stdout.write(f"{event}: {count}")
+        if options["reset"]:
+            reset_cache_stats()
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = "Проверяет, что материализованные ленты совпадают с подписками"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair", action="store_true",
+            help="Перестроить ленты, в которых найдены расхождения",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = list(
+            Follow.objects.values_list("user_id", flat=True).distinct()
+        )
+        # Ленты без подписок тоже проверяем: в них не должно быть записей
+        user_ids += list(TimelineEntry.objects.exclude(
+            user_id__in=user_ids
+        ).values_list("user_id", flat=True).distinct())
+        broken = []
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            batch = user_ids[start:start + BATCH_SIZE]
+            missing, extra = timeline.check(batch)
+            if missing or extra:
+                broken.extend({user_id for user_id, _ in missing | extra})
+                self.stdout.write(
+                    f"Недостает записей: {len(missing)}, "
+                    f"лишних записей: {len(extra)}"
+                )
+        if not broken:
+            self.stdout.write(self.style.SUCCESS("Ленты согласованы"))
+            return
+        if options["repair"]:
+            timeline.rebuild(broken)
+            self.stdout.write(self.style.SUCCESS(
+                f"Перестроено лент: {len(broken)}"
+            ))
+            return
+        raise CommandError(f"Расхождения в лентах: {len(broken)}")
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts import orphans
+
+
+class Command(BaseCommand):
+    help = ("Находит в MEDIA_ROOT файлы, на которые не ссылаются посты, "
+            "и удаляет их или переносит в карантин")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Только показать, что будет удалено",
+        )
+        parser.add_argument(
+            "--quarantine", metavar="DIR",
+            help="Переносить файлы в каталог DIR вместо удаления",
+        )
+        parser.add_argument(
+            "--min-age", type=int, default=orphans.MIN_AGE,
+            help="Не трогать файлы моложе стольких секунд",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=orphans.BATCH_SIZE,
+            help="Сколько файлов проверять за один запрос к базе",
+        )
+
+    def handle(self, *args, **options):
+        exclude = [options["quarantine"]] if options["quarantine"] else []
+        checked = found = size = 0
+        batches = orphans.find(
+            min_age=options["min_age"], exclude=exclude,
+            batch_size=options["batch_size"],
+        )
+        for count, batch in batches:
+            checked += count
+            found += len(batch)
+            size += sum(file_size for _, file_size in batch)
+            if options["verbosity"] > 1:
+                for name, _ in batch:
+                    self.stdout.write(name)
+            if not options["dry_run"]:
+                orphans.remove(
+                    [name for name, _ in batch],
+                    quarantine=options["quarantine"],
+                )
+            self.stdout.write(
+                f"Проверено файлов: {checked}, без ссылок: {found} "
+                f"({filesizeformat(size)})"
+            )
+        if options["dry_run"]:
+            action = "Можно освободить"
+        elif options["quarantine"]:
+            action = "Перенесено в карантин"
+        else:
+            action = "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action}: {found} файлов, {filesizeformat(size)}"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Готовит варианты картинок постов, у которых их еще нет"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Пересоздать варианты картинок всех постов",
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["all"]:
+            posts = posts.filter(thumbnail_data="")
+        count = 0
+        for post_id in posts.values_list("id", flat=True).iterator():
+            thumbnails.generate(post_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано постов: {count}"
+        ))
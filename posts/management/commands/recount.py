@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает счетчики постов и подписок пользователей "
+            "и число комментариев постов")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "usernames", nargs="*",
+            help="Пользователи, чьи счетчики пересчитать (по умолчанию все)",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options["usernames"]:
+            user_ids = list(User.objects.filter(
+                username__in=options["usernames"]
+            ).values_list("id", flat=True))
+        updated = stats.recount(user_ids)
+        post_ids = None
+        if user_ids is not None:
+            post_ids = list(Post.objects.filter(
+                author_id__in=user_ids).values_list("id", flat=True))
+        posts = stats.recount_comments(post_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитано пользователей: {updated}, постов: {posts}"
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts.uploads import upload_stats
+
+
+class Command(BaseCommand):
+    help = "Показывает число и скорость загрузок картинок постов"
+
+    def handle(self, *args, **options):
+        stats = upload_stats()
+        self.stdout.write(f"Принято: {stats['uploads']}")
+        self.stdout.write(f"Отвергнуто: {stats['rejected']}")
+        self.stdout.write(f"Байт: {stats['bytes']}")
+        self.stdout.write(
+            f"Скорость: {stats['throughput'] / 1024:.1f} КБ/с")
@@ -0,0 +1,177 @@
+import mimetypes
+import os
+import posixpath
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .storage import CONTENT_ADDRESSED_NAME
+
+# Год: больше не дают кешировать большинство браузеров и прокси
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """Разбирает заголовок Range. Возвращает (начало, конец включительно)
+    или None, если заголовок не разобран или в нем несколько диапазонов:
+    тогда отдается весь файл. Диапазон за концом файла -
+    RangeNotSatisfiable"""
+    units, _, ranges = header.partition("=")
+    if units.strip() != "bytes" or "," in ranges:
+        return None
+    start, separator, end = ranges.strip().partition("-")
+    if not separator:
+        return None
+    try:
+        if not start:
+            # Последние end байт
+            length = int(end)
+            if length <= 0 or not size:
+                raise RangeNotSatisfiable
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class RangeFile:
+    """Открытый файл, из которого читается не больше length байт.
+    fileno и tell отдаются от самого файла: WSGI-сервер с file_wrapper
+    отправит диапазон через sendfile по Content-Length"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+        self.name = file.name
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def _resolve(name):
+    """Нормализованное имя и путь медиафайла name. Выход за MEDIA_ROOT,
+    скрытые и недописанные файлы не отдаются"""
+    name = posixpath.normpath(name).lstrip("/")
+    parts = name.split("/")
+    if any(part.startswith(".") for part in parts) or name.endswith(".tmp"):
+        raise Http404
+    try:
+        path = safe_join(settings.MEDIA_ROOT, *parts)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(path):
+        raise Http404
+    return name, path
+
+
+def _etag(name, stat):
+    if CONTENT_ADDRESSED_NAME.search(name):
+        # Имя содержит хеш содержимого
+        return f'"{posixpath.splitext(posixpath.basename(name))[0]}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _set_headers(response, name, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if CONTENT_ADDRESSED_NAME.search(name):
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        # Файл под тем же именем может измениться, проверяем по ETag
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def _sendfile(name, path, content_type):
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE == "x-accel-redirect":
+        response["X-Accel-Redirect"] = (
+            settings.MEDIA_SENDFILE_PREFIX + quote(name))
+    else:
+        response["X-Sendfile"] = path
+    return response
+
+
+def _file_response(request, path, stat, content_type, etag, last_modified):
+    file = open(path, "rb")
+    byte_range = None
+    header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if header and if_range in (None, etag, http_date(last_modified)):
+        try:
+            byte_range = parse_range(header, stat.st_size)
+        except RangeNotSatisfiable:
+            file.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(
+            RangeFile(file, end - start + 1), content_type=content_type,
+            status=206,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Content-Length"] = end - start + 1
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+@require_safe
+def serve(request, path):
+    """Отдает медиафайл.
+
+    Проверяет имя и условные заголовки, а саму передачу при
+    MEDIA_SENDFILE отдает веб-серверу: X-Accel-Redirect для nginx
+    (внутренний location с префиксом MEDIA_SENDFILE_PREFIX, смотрящий
+    в MEDIA_ROOT) или X-Sendfile для Apache и lighttpd. Иначе отдает
+    файл сам через FileResponse с поддержкой Range. Содержимое файла
+    с именем по хешу не меняется, такие файлы кешируются навсегда"""
+    path, file_path = _resolve(path)
+    stat = os.stat(file_path)
+    etag = _etag(path, stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = (
+            mimetypes.guess_type(file_path)[0] or "application/octet-stream")
+        if settings.MEDIA_SENDFILE:
+            response = _sendfile(path, file_path, content_type)
+        else:
+            response = _file_response(
+                request, file_path, stat, content_type, etag, last_modified)
+    return _set_headers(response, path, etag, last_modified)
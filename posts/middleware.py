@@ -0,0 +1,101 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import surrogate
+from .caching import flush_stats, sync_local_cache
+
+# Заголовки, которые кэширующий прокси хранит вместе с телом ответа
+STORED_HEADERS = (
+    "Content-Type", "Cache-Control", "Vary", "ETag", "Last-Modified",
+    "Surrogate-Key", "X-Frame-Options", "X-Content-Type-Options",
+    "X-Next-Cursor",
+)
+
+
+class LocalCacheMiddleware:
+    """Раз в запрос сверяет локальный кэш процесса с общим и сбрасывает
+    в общий кэш накопленные счетчики попаданий"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sync_local_cache()
+        response = self.get_response(request)
+        flush_stats()
+        return response
+
+
+class SurrogateCacheMiddleware:
+    """Кэширующий обратный прокси для гостей - локальная замена CDN.
+
+    Хранит ответы с Cache-Control: public и s-maxage под адресом
+    страницы вместе с поколениями их суррогатных ключей. Ответ отдается,
+    пока ни один из ключей не очищен через purge. Запросы с cookie сессии
+    проходят мимо кэша"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (request.method not in ("GET", "HEAD")
+                or settings.SESSION_COOKIE_NAME in request.COOKIES):
+            return self.get_response(request)
+        key = self.cache_key(request)
+        response = self.get_cached(request, key)
+        if response is not None:
+            return response
+        # Ключи страницы известны только после рендеринга, поэтому до
+        # него запоминаем счетчик очисток
+        purges = surrogate.purges()
+        response = self.get_response(request)
+        self.store(key, response, purges)
+        return response
+
+    @staticmethod
+    def cache_key(request):
+        url = request.build_absolute_uri()
+        return f"surrogate:{hashlib.md5(url.encode()).hexdigest()}"
+
+    def get_cached(self, request, key):
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        keys, generations, content, headers = entry
+        if surrogate.generations(keys) != generations:
+            return None
+        response = HttpResponse(content)
+        for name, value in headers.items():
+            response[name] = value
+        response["X-Cache"] = "HIT"
+        return get_conditional_response(
+            request,
+            etag=headers.get("ETag"),
+            last_modified=parse_http_date_safe(
+                headers.get("Last-Modified", "")),
+            response=response,
+        )
+
+    def store(self, key, response, purges):
+        timeout = surrogate.shared_max_age(response)
+        keys = response.get("Surrogate-Key", "").split()
+        if (response.status_code != 200 or response.streaming
+                or response.cookies or not keys or not timeout):
+            return
+        generations = surrogate.generations(keys)
+        if surrogate.purges() != purges:
+            # Во время рендеринга что-то очистили: страница могла
+            # устареть, а поколения ее ключей - уже быть новыми
+            return
+        headers = {
+            name: response[name]
+            for name in STORED_HEADERS if response.has_header(name)
+        }
+        cache.set(key, (
+            keys, generations, response.content, headers,
+        ), timeout)
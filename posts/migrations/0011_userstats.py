@@ -0,0 +1,48 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    Post = apps.get_model("posts", "Post")
+    Follow = apps.get_model("posts", "Follow")
+    UserStats = apps.get_model("posts", "UserStats")
+    UserStats.objects.bulk_create(
+        (
+            UserStats(
+                user_id=user_id,
+                posts_count=Post.objects.filter(author_id=user_id).count(),
+                followers_count=Follow.objects.filter(
+                    author_id=user_id).count(),
+                following_count=Follow.objects.filter(
+                    user_id=user_id).count(),
+            )
+            for user_id in User.objects.values_list(
+                "id", flat=True).iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Записей')),
+                ('followers_count', models.IntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.IntegerField(default=0, verbose_name='Подписок')),
+            ],
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
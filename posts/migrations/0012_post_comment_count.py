@@ -0,0 +1,32 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:07
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_count(apps, schema_editor):
+    Post = apps.get_model("posts", "Post")
+    Comment = apps.get_model("posts", "Comment")
+    comments = Comment.objects.filter(
+        post_id=OuterRef("pk")
+    ).order_by().values("post_id").annotate(count=Count("pk")).values("count")
+    Post.objects.update(
+        comment_count=Coalesce(Subquery(comments), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_userstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.IntegerField(default=0, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(fill_comment_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.IntegerField(default=1, verbose_name='Версия'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail_data',
+            field=models.TextField(blank=True, default='', verbose_name='Миниатюры'),
+        ),
+    ]
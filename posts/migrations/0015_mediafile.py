@@ -0,0 +1,41 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:28
+
+import json
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def fill_refs(apps, schema_editor):
+    Post = apps.get_model("posts", "Post")
+    MediaFile = apps.get_model("posts", "MediaFile")
+    refs = Counter()
+    posts = Post.objects.exclude(image="").exclude(image__isnull=True)
+    for image, thumbnail_data in posts.values_list(
+            "image", "thumbnail_data").iterator():
+        refs[image] += 1
+        if thumbnail_data:
+            for variants in json.loads(thumbnail_data)["variants"].values():
+                refs.update(name for name, _ in variants)
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, refs=count) for name, count in refs.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_thumbnail_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Путь')),
+                ('refs', models.IntegerField(default=0, verbose_name='Ссылок')),
+            ],
+        ),
+        migrations.RunPython(fill_refs, migrations.RunPython.noop),
+    ]
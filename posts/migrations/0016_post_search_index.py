@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from posts import search
+
+
+def create_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        search.create_index(cursor)
+
+
+def drop_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        search.drop_index(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_mediafile'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created', 'id'], name='posts_comme_post_id_9660d8_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def segment(pk):
+    digits = ""
+    while pk:
+        pk, digit = divmod(pk, 36)
+        digits = DIGITS[digit] + digits
+    return digits.rjust(8, "0")
+
+
+def fill_paths(apps, schema_editor):
+    # До веток все комментарии были верхнего уровня
+    Comment = apps.get_model("posts", "Comment")
+    batch = []
+    for pk in Comment.objects.values_list("pk", flat=True).iterator():
+        batch.append(Comment(pk=pk, path=segment(pk)))
+        if len(batch) == 500:
+            Comment.objects.bulk_update(batch, ["path"])
+            batch = []
+    Comment.objects.bulk_update(batch, ["path"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_comment_cursor_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='posts_comme_post_id_9660d8_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='Ответ на'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Ответов'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', 'created', 'id'], name='posts_comme_post_id_24b04b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='posts_comme_post_id_abd11d_idx'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_pulled(apps, schema_editor):
+    # До флага авторы читались напрямую по числу подписчиков
+    UserStats = apps.get_model("posts", "UserStats")
+    UserStats.objects.filter(
+        followers_count__gte=settings.TIMELINE_FANOUT_THRESHOLD,
+    ).update(timeline_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='timeline_pulled',
+            field=models.BooleanField(default=False, verbose_name='Ленты читают посты напрямую'),
+        ),
+        migrations.RunPython(fill_pulled, migrations.RunPython.noop),
+    ]
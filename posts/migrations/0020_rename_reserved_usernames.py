@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import migrations
+
+from users.forms import is_reserved
+
+
+def rename_reserved(apps, schema_editor):
+    # Профили пользователей с такими именами перекрыты другими страницами
+    # сайта (/posts/, /search/, /group/posts/), поэтому имя получает
+    # числовой суффикс: posts -> posts-1
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    for user in User.objects.all().only("username").iterator():
+        if not is_reserved(user.username):
+            continue
+        suffix = 1
+        while True:
+            username = f"{user.username}-{suffix}"
+            if not (is_reserved(username) or User.objects.filter(
+                    username=username).exists()):
+                break
+            suffix += 1
+        User.objects.filter(pk=user.pk).update(username=username)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_userstats_timeline_pulled'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_reserved, migrations.RunPython.noop),
+    ]
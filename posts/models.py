@@ -1,8 +1,19 @@
+import json
+
 from django.db import models
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# MIME-типы вариантов картинок поста по расширению
+IMAGE_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для ленты: автор и группа в том же запросе"""
+        return self.select_related("author", "group")
+
 
 class Post(models.Model):
     text = models.TextField(verbose_name="текст", help_text="Введите текст")
@@ -28,12 +39,64 @@ class Post(models.Model):
         null=True,
         help_text="Выберите файл изображения"
     )
+    # Денормализованное число комментариев, обновляется сигналами Comment
+    comment_count = models.IntegerField("Комментариев", default=0)
+    # Версия карточки поста в кэше, см. posts/cards.py
+    version = models.IntegerField("Версия", default=1)
+    # Варианты картинки разной ширины в JSON: {width, height, variants:
+    # {расширение: [[путь, ширина], ...]}}, заполняется в фоне после
+    # загрузки, см. posts/thumbnails.py
+    thumbnail_data = models.TextField("Миниатюры", blank=True, default="")
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def image_variants(self):
+        """Данные для <picture>: размеры картинки, srcset по типам и
+        адрес JPEG наибольшей ширины. None, пока вариантов нет"""
+        if not self.thumbnail_data:
+            return None
+        data = json.loads(self.thumbnail_data)
+        storage = self.image.storage
+        sources = []
+        for extension, variants in data["variants"].items():
+            sources.append({
+                "type": IMAGE_TYPES[extension],
+                "srcset": ", ".join(
+                    f"{storage.url(name)} {width}w"
+                    for name, width in variants),
+                "src": storage.url(variants[-1][0]),
+            })
+        return {
+            "width": data["width"],
+            "height": data["height"],
+            "sources": sources,
+            "fallback": sources[-1],
+        }
+
+    def save(self, *args, **kwargs):
+        # comment_count и version меняются только F()-инкрементами, а
+        # thumbnail_data - фоновой задачей, поэтому при обновлении поста
+        # (например, из формы) их не перезаписываем
+        if not self._state.adding and "update_fields" not in kwargs:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in (
+                    "comment_count", "version", "thumbnail_data")
+            ]
+        super().save(*args, **kwargs)
+
     class Meta():
         ordering = ("-pub_date",)
+        # Индексы под курсорную пагинацию лент по (pub_date, id)
+        indexes = [
+            models.Index(fields=["pub_date", "id"]),
+            models.Index(fields=["author", "pub_date", "id"]),
+            models.Index(fields=["group", "pub_date", "id"]),
+        ]
 
 
 class Group(models.Model):
@@ -46,6 +109,17 @@ class Group(models.Model):
 
 
 class Comment(models.Model):
+    """Комментарий или ответ на комментарий.
+
+    Ветка хранится материализованным путем: path - id предков и самого
+    комментария, каждый в SEGMENT_WIDTH знаках base36. Пути ветки идут
+    подряд в индексе (post, path), поэтому поддерево читается одним
+    диапазоном, см. posts/threads.py"""
+
+    SEGMENT_WIDTH = 8
+    # Глубже ответы прикрепляются к предку: путь не длиннее 255 знаков
+    MAX_DEPTH = 30
+
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -62,9 +136,37 @@ class Comment(models.Model):
         help_text="Добавьте комментарий"
     )
     created = models.DateTimeField("Дата публикации", auto_now_add=True)
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="replies",
+        verbose_name="Ответ на",
+    )
+    path = models.CharField(
+        "Путь в ветке", max_length=255, default="", editable=False)
+    depth = models.PositiveSmallIntegerField(
+        "Глубина", default=0, editable=False)
+    reply_count = models.IntegerField("Ответов", default=0, editable=False)
+
+    @classmethod
+    def segment(cls, pk):
+        """Часть пути для комментария pk"""
+        digits = ""
+        while pk:
+            pk, digit = divmod(pk, 36)
+            digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+        return digits.rjust(cls.SEGMENT_WIDTH, "0")
 
     class Meta():
         ordering = ("-created",)
+        indexes = [
+            # Курсорная пагинация комментариев верхнего уровня
+            models.Index(fields=["post", "parent", "created", "id"]),
+            # Чтение веток диапазоном путей
+            models.Index(fields=["post", "path"]),
+        ]
 
 
 class Follow(models.Model):
@@ -89,3 +191,68 @@ class Follow(models.Model):
                 name="unique_object"
             ),
         ]
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок: пост автора,
+    разложенный в ленту каждого подписчика при публикации"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="Владелец ленты",
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name="Пост",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автор поста",
+    )
+    # Копия post.pub_date, чтобы лента читалась одним проходом по индексу
+    pub_date = models.DateTimeField("Дата публикации")
+
+    class Meta():
+        ordering = ("-pub_date", "-post_id")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                name="unique_timeline_entry"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "pub_date", "post"]),
+            models.Index(fields=["user", "author"]),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счетчики пользователя. Обновляются атомарными
+    F()-инкрементами при создании и удалении постов и подписок"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+        verbose_name="Пользователь",
+    )
+    posts_count = models.IntegerField("Записей", default=0)
+    followers_count = models.IntegerField("Подписчиков", default=0)
+    following_count = models.IntegerField("Подписок", default=0)
+    # Посты автора не раскладываются по лентам, а подмешиваются при
+    # чтении, см. posts/timeline.py
+    timeline_pulled = models.BooleanField(
+        "Ленты читают посты напрямую", default=False)
+
+
+class MediaFile(models.Model):
+    """Файл в хранилище с адресацией по содержимому и число ссылок на
+    него из постов. Файл удаляется, когда ссылок не остается,
+    см. posts/storage.py"""
+    name = models.CharField("Путь", max_length=255, primary_key=True)
+    refs = models.IntegerField("Ссылок", default=0)
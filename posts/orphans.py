@@ -0,0 +1,131 @@
+import os
+import time
+from functools import reduce
+from operator import or_
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Q
+
+from .models import MediaFile, Post
+
+# Сколько имен проверять в одном запросе к базе
+BATCH_SIZE = 500
+# Файл младше этого может принадлежать посту, который еще сохраняется
+MIN_AGE = 60 * 60
+# Варианты ищем в thumbnail_data по подстроке, условий в запросе не больше
+CONTAINS_BATCH_SIZE = 50
+
+
+def walk(root, exclude=()):
+    """Обходит файлы под root и отдает пары (имя относительно root,
+    os.stat). В памяти только стек еще не обойденных каталогов, файлы
+    каталога читаются потоком"""
+    exclude = {os.path.abspath(path) for path in exclude}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            # Каталог удалили, пока обходили остальные
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.abspath(entry.path) not in exclude:
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, root)
+                    yield name.replace(os.sep, "/"), entry.stat()
+
+
+def batches(items, size=BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _sorl_keys(names):
+    """Ключи миниатюр sorl в его хранилище ключ-значение"""
+    from sorl.thumbnail.images import ImageFile
+    from sorl.thumbnail.kvstores.base import add_prefix
+    return {add_prefix(ImageFile(name).key): name for name in names}
+
+
+def referenced(names):
+    """Имена из names, на которые есть ссылки: из счетчиков MediaFile,
+    картинок постов, их вариантов и миниатюр sorl"""
+    found = set(MediaFile.objects.filter(
+        name__in=names, refs__gt=0).values_list("name", flat=True))
+    found.update(Post.objects.filter(
+        image__in=names).values_list("image", flat=True))
+    # В хранилище с адресацией по содержимому варианты учтены в MediaFile,
+    # иначе ищем их имена в thumbnail_data
+    variants = [
+        name for name in names
+        if name not in found and name.startswith("posts/variants/")
+    ]
+    for batch in batches(variants, CONTAINS_BATCH_SIZE):
+        condition = reduce(
+            or_, (Q(thumbnail_data__contains=f'"{name}"') for name in batch))
+        for thumbnail_data in Post.objects.filter(condition).values_list(
+                "thumbnail_data", flat=True):
+            found.update(
+                name for name in batch if f'"{name}"' in thumbnail_data)
+    if apps.is_installed("sorl.thumbnail"):
+        from sorl.thumbnail.conf import settings as sorl_settings
+        from sorl.thumbnail.models import KVStore
+        keys = _sorl_keys(
+            name for name in names
+            if name.startswith(sorl_settings.THUMBNAIL_PREFIX))
+        found.update(keys[key] for key in KVStore.objects.filter(
+            key__in=keys).values_list("key", flat=True))
+    return found
+
+
+def find(root=None, min_age=MIN_AGE, exclude=(), batch_size=BATCH_SIZE):
+    """Ищет файлы без ссылок под MEDIA_ROOT. Отдает пачки
+    (проверено файлов в пачке, [(имя, размер), ...] сирот)"""
+    root = root or settings.MEDIA_ROOT
+    deadline = time.time() - min_age
+    for batch in batches(walk(root, exclude), batch_size):
+        candidates = {
+            name: stat.st_size for name, stat in batch
+            if stat.st_mtime < deadline
+        }
+        found = referenced(list(candidates))
+        yield len(batch), [
+            (name, size) for name, size in candidates.items()
+            if name not in found
+        ]
+
+
+def _forget_sorl_thumbnails(name):
+    # Записи sorl об исходной картинке и ее миниатюры, которые без нее
+    # уже не понадобятся
+    if apps.is_installed("sorl.thumbnail"):
+        from sorl.thumbnail import default
+        from sorl.thumbnail.images import ImageFile
+        default.kvstore.delete(ImageFile(name))
+
+
+def remove(names, root=None, quarantine=None):
+    """Удаляет файлы names или переносит их в каталог quarantine
+    с сохранением относительных путей"""
+    root = root or settings.MEDIA_ROOT
+    for name in names:
+        path = os.path.join(root, name)
+        if quarantine:
+            os.renames(path, os.path.join(quarantine, name))
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        _forget_sorl_thumbnails(name)
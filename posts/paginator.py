@@ -0,0 +1,207 @@
+import base64
+import binascii
+import heapq
+from itertools import islice
+from operator import itemgetter
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+def encode_cursor(value, pk):
+    """Упаковывает пару (значение поля, id) в непрозрачный токен"""
+    raw = f"{value.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Распаковывает токен в пару (значение поля, id).
+    Для испорченного токена возвращает None"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        value, pk = raw.decode().rsplit("|", 1)
+        value = parse_datetime(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+class CursorPage(Page):
+    """Страница курсорного паджинатора. Вместо номера страницы хранит
+    токены соседних страниц ?after= и ?before="""
+
+    def __init__(self, rows, paginator, has_next, has_previous):
+        # Ключи считаем по исходным строкам выборки: prepare может
+        # заменить их другими объектами (например, записи ленты - постами)
+        self._first_key = self._last_key = None
+        if rows:
+            self._first_key = paginator.key_for(rows[0])
+            self._last_key = paginator.key_for(rows[-1])
+        # Номера у страницы нет, соседние страницы - токены курсоров
+        super().__init__(paginator.prepare(rows), None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} items>"
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        """Номеров у страниц нет: следующая страница - токен ?after="""
+        return self.next_cursor
+
+    def previous_page_number(self):
+        """Предыдущая страница - токен ?before="""
+        return self.previous_cursor
+
+    def start_index(self):
+        """Позиция страницы в выборке без COUNT и OFFSET неизвестна"""
+        return None
+
+    def end_index(self):
+        return None
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(*self._last_key)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(*self._first_key)
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (field, tiebreaker) в порядке убывания.
+
+    В отличие от Paginator не делает COUNT(*) и OFFSET: каждая страница -
+    это выборка по индексу с LIMIT per_page + 1, поэтому глубокие страницы
+    стоят столько же, сколько первая."""
+
+    def __init__(self, object_list, per_page, field="pub_date",
+                 tiebreaker="pk", prepare=None):
+        super().__init__(object_list, per_page)
+        self.field = field
+        self.tiebreaker = tiebreaker
+        self._prepare = prepare
+
+    def key_for(self, row):
+        return getattr(row, self.field), getattr(row, self.tiebreaker)
+
+    def encode_cursor(self, value, pk):
+        return encode_cursor(value, pk)
+
+    def decode_cursor(self, token):
+        return decode_cursor(token)
+
+    def prepare(self, rows):
+        """Превращает строки выборки в объекты страницы"""
+        if self._prepare is None:
+            return rows
+        return self._prepare(rows)
+
+    def fetch(self, after=None, before=None, limit=None):
+        """Возвращает до limit строк после ключа after (по убыванию)
+        или перед ключом before (по возрастанию)"""
+        field, tiebreaker = self.field, self.tiebreaker
+        if before:
+            value, pk = before
+            queryset = self.object_list.filter(
+                Q(**{f"{field}__gt": value})
+                | Q(**{field: value, f"{tiebreaker}__gt": pk})
+            ).order_by(field, tiebreaker)
+        else:
+            queryset = self.object_list.order_by(
+                f"-{field}", f"-{tiebreaker}")
+        if after:
+            value, pk = after
+            queryset = queryset.filter(
+                Q(**{f"{field}__lt": value})
+                | Q(**{field: value, f"{tiebreaker}__lt": pk})
+            )
+        return list(queryset[:limit])
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед курсором
+        before. Без курсоров (или с испорченным) - первую страницу"""
+        after = self.decode_cursor(after)
+        before = None if after else self.decode_cursor(before)
+        rows = self.fetch(after, before, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if before:
+            return CursorPage(rows[::-1], self, True, has_more)
+        return CursorPage(rows, self, has_more, bool(after))
+
+    def page(self, number):
+        """Номер страницы здесь - токен ?after=, как у
+        CursorPage.next_page_number()"""
+        return self.get_page(after=number)
+
+    @property
+    def num_pages(self):
+        """Число страниц без COUNT(*) неизвестно"""
+        return None
+
+    @property
+    def page_range(self):
+        return range(0)
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Сливает несколько курсорных паджинаторов с общим ключом в одну
+    ленту. Каждый источник отдает не больше per_page + 1 строк, а слияние
+    идет через кучу, так что страница ограничена по времени и памяти."""
+
+    def __init__(self, paginators, per_page):
+        super().__init__([], per_page)
+        self.paginators = paginators
+
+    @cached_property
+    def count(self):
+        return sum(paginator.count for paginator in self.paginators)
+
+    def key_for(self, row):
+        return row[0]
+
+    def prepare(self, rows):
+        return [obj for _, obj in rows]
+
+    def fetch(self, after=None, before=None, limit=None):
+        streams = []
+        for paginator in self.paginators:
+            rows = paginator.fetch(after, before, limit)
+            streams.append(zip(
+                (paginator.key_for(row) for row in rows),
+                paginator.prepare(rows),
+            ))
+        merged = heapq.merge(
+            *streams, key=itemgetter(0), reverse=not before)
+        return list(islice(merged, limit))
+
+
+def get_cursor_page(request, object_list, per_page, **kwargs):
+    """Возвращает страницу по курсорам ?after=/?before= из запроса"""
+    paginator = CursorPaginator(object_list, per_page, **kwargs)
+    return paginator.get_page(
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
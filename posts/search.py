@@ -0,0 +1,171 @@
+import base64
+import binascii
+import re
+
+from django.db import connection
+
+from .models import Post
+from .paginator import CursorPaginator
+
+FTS_TABLE = "posts_post_fts"
+# Сколько слов запроса учитывать: каждое слово - отдельный обход индекса
+MAX_TERMS = 16
+
+
+def _normalized(column):
+    # unicode61 не приравнивает ё к е, делаем это сами и в индексе,
+    # и в запросе
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+TRIGGERS = {
+    f"{FTS_TABLE}_insert": f"""
+        AFTER INSERT ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, text)
+            VALUES (new.id, {_normalized("new.text")});
+        END""",
+    f"{FTS_TABLE}_delete": f"""
+        AFTER DELETE ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, {_normalized("old.text")});
+        END""",
+    f"{FTS_TABLE}_update": f"""
+        AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, {_normalized("old.text")});
+            INSERT INTO {FTS_TABLE}(rowid, text)
+            VALUES (new.id, {_normalized("new.text")});
+        END""",
+}
+
+
+def create_triggers(cursor):
+    """Триггеры, которые держат индекс в согласии с posts_post. SQLite
+    теряет их, когда миграция пересоздает таблицу, поэтому они
+    создаются заново после каждой миграции"""
+    for name, body in TRIGGERS.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def create_index(cursor):
+    """Создает полнотекстовый индекс постов FTS5 и заполняет его"""
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        "text, content='posts_post', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, text) "
+        f"SELECT id, {_normalized('text')} FROM posts_post"
+    )
+    create_triggers(cursor)
+
+
+def drop_index(cursor):
+    for name in TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def to_match(query):
+    """Превращает строку поиска в запрос FTS5: все слова должны
+    встретиться, каждое как начало слова в тексте. Операторы FTS5
+    в строке поиска не работают. Пустая строка - нет запроса"""
+    query = query.replace("ё", "е").replace("Ё", "Е")
+    terms = re.findall(r"\w+", query)[:MAX_TERMS]
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def match_ids(query):
+    """SQL и параметры выборки id постов по запросу для фильтра
+    id__in=RawSQL(...)"""
+    return (
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        [to_match(query)],
+    )
+
+
+def ranked_sql(conditions=(), order="DESC", limit=True):
+    """SQL выборки (оценка, id) совпадений с запросом MATCH %s по
+    релевантности. conditions - условия на hits и posts_post"""
+    where = " AND ".join(conditions) or "1"
+    sql = (
+        f"WITH hits AS MATERIALIZED ("
+        f"SELECT rowid AS id, -rank AS score FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s) "
+        f"SELECT hits.score, hits.id FROM hits "
+        f"INNER JOIN posts_post ON posts_post.id = hits.id "
+        f"WHERE {where} "
+        f"ORDER BY hits.score {order}, hits.id {order}"
+    )
+    return sql + " LIMIT %s" if limit else sql
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорный паджинатор результатов поиска по убыванию релевантности
+    (bm25), при равной релевантности - по убыванию id.
+
+    Функции ранжирования FTS5 нельзя сравнивать в WHERE, поэтому
+    совпадения сначала материализуются вместе с оценкой, и курсор
+    применяется уже к ним. Страница стоит одного обхода индекса по словам
+    запроса и сортировки совпадений, но не всей таблицы постов"""
+
+    def __init__(self, query, per_page, group_id=None, author_id=None):
+        super().__init__([], per_page)
+        self.match = to_match(query)
+        self.group_id = group_id
+        self.author_id = author_id
+
+    def key_for(self, row):
+        return row
+
+    def encode_cursor(self, value, pk):
+        raw = f"{value!r}|{pk}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, token):
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            value, pk = raw.decode().rsplit("|", 1)
+            return float(value), int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+
+    def prepare(self, rows):
+        posts = Post.objects.for_feed().in_bulk([pk for _, pk in rows])
+        page = []
+        for score, pk in rows:
+            # Пост могли удалить между запросами
+            if pk in posts:
+                posts[pk].score = score
+                page.append(posts[pk])
+        return page
+
+    def fetch(self, after=None, before=None, limit=None):
+        if not self.match:
+            return []
+        conditions, params = [], [self.match]
+        if self.group_id is not None:
+            conditions.append("posts_post.group_id = %s")
+            params.append(self.group_id)
+        if self.author_id is not None:
+            conditions.append("posts_post.author_id = %s")
+            params.append(self.author_id)
+        order = "DESC"
+        for key, operator in ((after, "<"), (before, ">")):
+            if key:
+                conditions.append(
+                    f"(hits.score {operator} %s OR "
+                    f"(hits.score = %s AND hits.id {operator} %s))"
+                )
+                params.extend([key[0], key[0], key[1]])
+        if before:
+            order = "ASC"
+        sql = ranked_sql(conditions, order, limit is not None)
+        if limit is not None:
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [tuple(row) for row in cursor.fetchall()]
@@ -0,0 +1,208 @@
+from django.db import connections
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import cards, search, stats, storage, thumbnails, timeline
+from .caching import bump_generations, post_generations
+from .surrogate import post_keys, purge
+from .models import Comment, Follow, Group, Post, User
+
+
+# id постов, которые сейчас удаляются вместе с комментариями
+_deleting_posts = set()
+
+
+def _old_value(instance, field):
+    """Значение поля в базе до сохранения instance"""
+    if instance.pk is None:
+        return None
+    return type(instance).objects.filter(
+        pk=instance.pk).values_list(field, flat=True).first()
+
+
+def _bump_post_pages(post_id):
+    row = Post.objects.filter(pk=post_id).values_list(
+        "author__username", "group__slug").first()
+    if row is not None:
+        bump_generations(*post_generations(*row))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    old = None
+    if instance.pk is not None:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            "group__slug", "image").first()
+    instance._old_group_slug, instance._old_image = old or (None, None)
+    # Новый файл сохранится в хранилище уже после сигнала и добавит
+    # ссылку, даже если его имя совпадет со старым
+    instance._image_uploaded = bool(
+        instance.image and not instance.image._committed)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(instance.author_id, posts_count=1)
+        timeline.push_post(instance)
+    else:
+        cards.bump_versions(Post.objects.filter(pk=instance.pk))
+    if (instance._image_uploaded
+            or (instance.image.name or None) != (instance._old_image or None)):
+        storage.release([instance._old_image], instance.image.storage)
+    _bump_post_pages(instance.pk)
+    if instance._old_group_slug:
+        bump_generations(f"group:{instance._old_group_slug}")
+    # Страницы со старой группой поста помечены ключом самого поста
+    purge(*post_keys(instance), *(["index"] if created else []))
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    # Комментарии удаляются каскадом до поста: счетчики, поколения и
+    # очистка по каждому не нужны, страницы поста сбросит post_deleted
+    _deleting_posts.add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    _deleting_posts.discard(instance.pk)
+    stats.bump(instance.author_id, posts_count=-1)
+    storage.release(
+        [instance.image.name,
+         *thumbnails.variant_names(instance.thumbnail_data)],
+        instance.image.storage,
+    )
+    slug = instance.group.slug if instance.group_id else None
+    bump_generations(*post_generations(instance.author.username, slug))
+    purge(*post_keys(instance), "index")
+
+
+def _bump_follow_pages(follow):
+    usernames = User.objects.filter(
+        pk__in=[follow.user_id, follow.author_id]
+    ).values_list("username", flat=True)
+    bump_generations(*(f"author:{username}" for username in usernames))
+    purge(f"author-{follow.user_id}", f"author-{follow.author_id}")
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(instance.user_id, following_count=1)
+        stats.bump(instance.author_id, followers_count=1)
+        timeline.follow(instance.user_id, instance.author_id)
+        _bump_follow_pages(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    stats.bump(instance.user_id, following_count=-1)
+    stats.bump(instance.author_id, followers_count=-1)
+    timeline.unfollow(instance.user_id, instance.author_id)
+    _bump_follow_pages(instance)
+
+
+def _place_in_thread(comment):
+    """Записывает путь и глубину нового комментария и учитывает его
+    в счетчике ответов родителя"""
+    path, depth = "", 0
+    if comment.parent_id is not None:
+        path, depth = comment.parent.path, comment.parent.depth + 1
+        Comment.objects.filter(pk=comment.parent_id).update(
+            reply_count=F("reply_count") + 1)
+    comment.path = path + Comment.segment(comment.pk)
+    comment.depth = depth
+    Comment.objects.filter(pk=comment.pk).update(
+        path=comment.path, depth=depth)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        _place_in_thread(instance)
+        stats.bump_comments(instance.post_id, 1)
+        _bump_post_pages(instance.post_id)
+        purge(f"post-{instance.post_id}")
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in _deleting_posts:
+        return
+    if instance.parent_id is not None:
+        Comment.objects.filter(pk=instance.parent_id).update(
+            reply_count=F("reply_count") - 1)
+    stats.bump_comments(instance.post_id, -1)
+    _bump_post_pages(instance.post_id)
+    purge(f"post-{instance.post_id}")
+
+
+@receiver(pre_save, sender=User)
+def author_saving(sender, instance, update_fields, **kwargs):
+    # last_login при входе сохраняется отдельно, лишний запрос не нужен
+    if update_fields and "username" not in update_fields:
+        instance._old_username = instance.username
+        return
+    instance._old_username = _old_value(instance, "username")
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, **kwargs):
+    # Карточки и страницы показывают только username автора
+    old = instance._old_username
+    if created or old == instance.username:
+        return
+    cards.bump_versions(instance.posts.all())
+    slugs = instance.posts.filter(group__isnull=False).values_list(
+        "group__slug", flat=True).distinct()
+    bump_generations(
+        "index",
+        f"author:{old}",
+        f"author:{instance.username}",
+        *(f"group:{slug}" for slug in slugs),
+    )
+    purge(f"author-{instance.pk}")
+
+
+@receiver(post_delete, sender=User)
+def author_deleted(sender, instance, **kwargs):
+    # Профиль без постов ничем другим не очищается, а username и id
+    # могут достаться новому пользователю
+    bump_generations(f"author:{instance.username}")
+    purge(f"author-{instance.pk}")
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, **kwargs):
+    instance._old_slug = _old_value(instance, "slug")
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    cards.bump_versions(instance.posts.all())
+    bump_generations(
+        "index", f"group:{instance._old_slug}", f"group:{instance.slug}")
+    purge(f"group-{instance.pk}")
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # Посты группы теряют ее через SET NULL в SQL, без сигналов
+    cards.bump_versions(instance.posts.all())
+    bump_generations("index", f"group:{instance.slug}")
+    purge(f"group-{instance.pk}")
+
+
+@receiver(post_migrate)
+def search_index_migrated(sender, using, **kwargs):
+    if sender.name != "posts":
+        return
+    with connections[using].cursor() as cursor:
+        tables = connections[using].introspection.table_names(cursor)
+        if search.FTS_TABLE in tables:
+            search.create_triggers(cursor)
@@ -0,0 +1,74 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def get_stats(user):
+    """Счетчики пользователя. Если строки еще нет - нулевые"""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def bump(user_id, **deltas):
+    """Атомарно изменяет счетчики пользователя на deltas"""
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    updated = UserStats.objects.filter(user_id=user_id).update(**changes)
+    if updated or min(deltas.values()) < 0:
+        # Строку при уменьшении не создаем: ее нет только у пользователя,
+        # которого как раз удаляют каскадом
+        return
+    UserStats.objects.get_or_create(user_id=user_id)
+    UserStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def bump_comments(post_id, delta):
+    """Атомарно изменяет число комментариев поста и версию его карточки"""
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F("comment_count") + delta,
+        version=F("version") + 1,
+    )
+
+
+def _count(queryset, field, ref="user_id"):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef(ref)}).order_by().values(
+            field).annotate(count=Count("pk")).values("count")
+    ), Value(0))
+
+
+def recount(user_ids=None):
+    """Пересчитывает счетчики по таблицам постов и подписок"""
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id)
+         for user_id in users.values_list("id", flat=True).iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    stats = UserStats.objects.all()
+    if user_ids is not None:
+        stats = stats.filter(user_id__in=user_ids)
+    return stats.update(
+        posts_count=_count(Post.objects.all(), "author_id"),
+        followers_count=_count(Follow.objects.all(), "author_id"),
+        following_count=_count(Follow.objects.all(), "user_id"),
+    )
+
+
+def recount_comments(post_ids=None):
+    """Пересчитывает число комментариев постов и ответов на комментарии"""
+    posts = Post.objects.all()
+    comments = Comment.objects.all()
+    if post_ids is not None:
+        posts = posts.filter(id__in=post_ids)
+        comments = comments.filter(post_id__in=post_ids)
+    comments.update(
+        reply_count=_count(Comment.objects.all(), "parent_id", ref="pk"))
+    return posts.update(
+        comment_count=_count(Comment.objects.all(), "post_id", ref="pk")
+    )
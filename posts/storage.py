@@ -0,0 +1,112 @@
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connection, transaction
+from django.db.models import F
+
+# Имя файла в хранилище: <каталог>/<2 знака>/<2 знака>/<sha256>.<расширение>
+CONTENT_ADDRESSED_NAME = re.compile(
+    r"(^|/)([0-9a-f]{2})/([0-9a-f]{2})/\2\3[0-9a-f]{60}(\.\w+)?$")
+
+
+def is_content_addressed(name):
+    """Имя выдано ContentAddressedStorage: содержимое файла под ним
+    никогда не меняется"""
+    return bool(CONTENT_ADDRESSED_NAME.search(name))
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, которое называет файлы по SHA-256 содержимого и
+    раскладывает их по каталогам по первым знакам хеша.
+
+    Одинаковые файлы хранятся один раз: повторное сохранение только
+    увеличивает счетчик ссылок MediaFile. release() уменьшает счетчик
+    и после фиксации транзакции удаляет файл, если ссылок не осталось.
+    Каталог из имени (upload_to) сохраняется, расширение приводится
+    к нижнему регистру"""
+
+    def hashed_name(self, name, content):
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = content_hash(content)
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], digest + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        # Блокировка строки счетчика упорядочивает сохранение с release:
+        # файл не удалится между проверкой exists и увеличением счетчика
+        with transaction.atomic():
+            self.acquire(name)
+            if not self.exists(name):
+                # Пишем во временный файл и переименовываем: одинаковое
+                # содержимое, сохраняемое параллельно, не портит файл
+                temporary = super()._save(
+                    f"{name}.{uuid.uuid4().hex}.tmp", content)
+                os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Имя все равно заменяется хешем в _save
+        return name
+
+    def acquire(self, name):
+        """Добавляет ссылку на файл name.
+
+        Один оператор INSERT ... ON CONFLICT вместо чтения и записи:
+        транзакция сразу берет блокировку на запись и не сталкивается
+        с параллельными писателями при повышении блокировки чтения"""
+        from .models import MediaFile
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {MediaFile._meta.db_table} (name, refs) "
+                f"VALUES (%s, 1) "
+                f"ON CONFLICT (name) DO UPDATE SET refs = refs + 1",
+                [name],
+            )
+
+    def release(self, name):
+        """Убирает ссылку на файл name. Файл без ссылок удаляется после
+        фиксации транзакции: при ее откате ссылки в базе остаются, и
+        файл должен остаться тоже"""
+        from .models import MediaFile
+        MediaFile.objects.filter(name=name).update(refs=F("refs") - 1)
+        transaction.on_commit(lambda: self._delete_unreferenced(name))
+
+    def _delete_unreferenced(self, name):
+        # Удаление строки берет блокировку на запись, поэтому acquire
+        # того же файла ждет, пока файл не удален, и затем пишет его
+        # заново. Если ссылку успели добавить, строка и файл остаются
+        from .models import MediaFile
+        with transaction.atomic():
+            deleted, _ = MediaFile.objects.filter(
+                name=name, refs__lte=0).delete()
+            if deleted:
+                self.delete(name)
+
+
+def acquire(names, storage=default_storage):
+    """Добавляет ссылки на уже сохраненные файлы names"""
+    if isinstance(storage, ContentAddressedStorage):
+        for name in names:
+            storage.acquire(name)
+
+
+def release(names, storage=default_storage):
+    """Убирает ссылки на файлы names. Для других хранилищ ничего не
+    делает: файлы в них не считаются и не удаляются"""
+    if isinstance(storage, ContentAddressedStorage):
+        for name in filter(None, names):
+            storage.release(name)
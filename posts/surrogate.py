@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .caching import bump_generations, get_generations
+
+# Счетчик всех очисток по суррогатным ключам
+PURGES_KEY = "surrogate:purges"
+
+
+def post_keys(post):
+    """Суррогатные ключи, от которых зависит карточка поста"""
+    keys = [f"post-{post.pk}", f"author-{post.author_id}"]
+    if post.group_id:
+        keys.append(f"group-{post.group_id}")
+    return keys
+
+
+def page_keys(posts, *keys):
+    """Ключи страницы: собственные keys и ключи всех постов на ней"""
+    result = dict.fromkeys(keys)
+    for post in posts:
+        result.update(dict.fromkeys(post_keys(post)))
+    return list(result)
+
+
+def set_cache_headers(request, response, keys):
+    """Помечает ответ суррогатными ключами. Гостевые страницы можно
+    держать в общем кэше перед Django до очистки по ключу (purge), а
+    браузер каждый раз перепроверяет их по ETag"""
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=0,
+            s_maxage=settings.SURROGATE_CACHE_TIMEOUT,
+        )
+    patch_vary_headers(response, ["Cookie"])
+    response["Surrogate-Key"] = " ".join(keys)
+    return response
+
+
+def purge(*keys):
+    """Очищает все ответы с любым из суррогатных ключей keys"""
+    bump_generations(*(f"surrogate:{key}" for key in keys))
+    # Счетчик увеличивается после поколений: кто прочитал его до очистки,
+    # увидит изменение
+    try:
+        cache.incr(PURGES_KEY)
+    except ValueError:
+        cache.add(PURGES_KEY, 1, None)
+
+
+def purges():
+    """Число очисток из общего кэша, минуя локальный. Ответ,
+    во время рендеринга которого оно изменилось, мог устареть"""
+    return cache.get(PURGES_KEY)
+
+
+def generations(keys):
+    """Текущие поколения суррогатных ключей"""
+    return get_generations([f"surrogate:{key}" for key in keys])
+
+
+def shared_max_age(response):
+    """Срок хранения ответа в общем кэше: s-maxage из Cache-Control
+    публичного ответа, иначе None"""
+    directives = {}
+    for directive in response.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value
+    if "public" not in directives:
+        return None
+    value = directives.get("s-maxage", directives.get("max-age", ""))
+    return int(value) if value.isdigit() else None
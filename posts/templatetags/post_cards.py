@@ -0,0 +1,16 @@
+from django import template
+
+from posts.cards import render_cards
+
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    return render_cards(list(posts), context["user"])
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    return render_cards([post], context["user"])
@@ -0,0 +1,124 @@
+import json
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username="Sergey", first_name="Сергей", last_name="Петров")
+        cls.author = User.objects.create(username="Oleg")
+        cls.group = Group.objects.create(
+            title="Заголовок", slug="test-slug", description="Текст")
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for i in range(25):
+            post = Post.objects.create(
+                text=f"Пост {i}", author=cls.author if i % 2 else cls.user,
+                group=cls.group if i % 3 else None,
+            )
+        cls.post = post
+        cls.comment = Comment.objects.create(
+            text="Комментарий", author=cls.user, post=post)
+
+    def setUp(self):
+        self.client = Client()
+
+    def get(self, url, status=200, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(response["Content-Type"], "application/json")
+        if response.streaming:
+            return json.loads(b"".join(response.streaming_content))
+        return json.loads(response.content)
+
+    def test_posts_pages(self):
+        """Страницы постов идут по ссылкам links.next до конца"""
+        url = reverse("api:posts")
+        seen = []
+        while url:
+            document = self.get(url)
+            seen += [item["id"] for item in document["data"]]
+            url = document["links"]["next"]
+        expected = list(Post.objects.order_by(
+            "-pub_date", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_sparse_fields_and_include(self):
+        """fields= выбирает поля, include= добавляет авторов и группы
+        отдельным запросом на каждый ресурс"""
+        with CaptureQueriesContext(connection) as queries:
+            document = self.get(
+                reverse("api:posts"), fields="text,author",
+                include="author,group", **{"fields[users]": "full_name"},
+                limit=10,
+            )
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(set(document["data"][0]), {"id", "text", "author"})
+        self.assertEqual(
+            {user["id"] for user in document["included"]["users"]},
+            {self.user.id, self.author.id},
+        )
+        self.assertIn({"id": self.user.id, "full_name": "Сергей Петров"},
+                      document["included"]["users"])
+        self.assertEqual(
+            document["included"]["groups"][0]["slug"], self.group.slug)
+
+    def test_filters(self):
+        document = self.get(
+            reverse("api:posts"), group=self.group.slug,
+            author=self.author.username, limit=100,
+        )
+        self.assertEqual(
+            [item["id"] for item in document["data"]],
+            list(Post.objects.filter(
+                group=self.group, author=self.author,
+            ).order_by("-pub_date", "-id").values_list("id", flat=True)),
+        )
+
+    def test_detail_endpoints(self):
+        post = self.get(reverse("api:post", args=[self.post.id]))["data"]
+        self.assertEqual(post["text"], self.post.text)
+        comments = self.get(
+            reverse("api:post_comments", args=[self.post.id]))["data"]
+        self.assertEqual(comments[0]["id"], self.comment.id)
+        group = self.get(reverse("api:group", args=[self.group.slug]))
+        self.assertEqual(group["data"]["title"], self.group.title)
+        user = self.get(reverse("api:user", args=[self.author.username]))
+        self.assertEqual(user["data"]["followers_count"], 1)
+        followers = self.get(
+            reverse("api:followers", args=[self.author.username]),
+            include="user",
+        )
+        self.assertEqual(followers["data"][0]["user"], self.user.username)
+        self.assertEqual(
+            followers["included"]["users"][0]["username"], self.user.username)
+        following = self.get(
+            reverse("api:following", args=[self.author.username]))
+        self.assertEqual(following["data"], [])
+
+    def test_etag(self):
+        """Неизменившийся ответ перепроверяется по ETag"""
+        url = reverse("api:post", args=[self.post.id])
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.filter(id=self.post.id).update(text="Новый текст")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_errors(self):
+        """Ошибки отдаются в JSON"""
+        url = reverse("api:posts")
+        self.assertIn("error", self.get(url, 400, fields="password"))
+        self.assertIn("error", self.get(url, 400, include="comments"))
+        self.assertIn("error", self.get(url, 400, limit="1000"))
+        self.assertIn(
+            "error", self.get(reverse("api:user", args=["nobody"]), 404))
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 405)
@@ -0,0 +1,175 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.caching import (cache_stats, clear_local_cache, get_generations,
+                           get_many_or_compute, get_or_compute,
+                           reset_cache_stats)
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.user = User.objects.create(username="Sergey")
+        self.reader = User.objects.create(username="Oleg")
+        self.group = Group.objects.create(
+            title="Заголовок",
+            slug="test-slug",
+            description="Текст",
+        )
+        self.post = Post.objects.create(
+            text="Текст поста", author=self.user, group=self.group)
+        self.guest_client = Client()
+        self.urls = [
+            reverse("index"),
+            reverse("group_posts", args=[self.group.slug]),
+            reverse("profile", args=[self.user.username]),
+        ]
+
+    def test_hit_needs_no_queries(self):
+        """Повторный запрос гостя отдается из кэша без запросов к базе"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_comment_invalidates_feeds(self):
+        """Комментарий сбрасывает все ленты с постом"""
+        for url in self.urls:
+            self.guest_client.get(url)
+        Comment.objects.create(text="Текст", author=self.user, post=self.post)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, "Комментариев")
+
+    def test_edit_moving_group_invalidates_old_group(self):
+        """Перенос поста в другую группу сбрасывает страницу старой"""
+        url = reverse("group_posts", args=[self.group.slug])
+        self.guest_client.get(url)
+        self.post.group = Group.objects.create(
+            title="Другая", slug="other", description="Текст")
+        self.post.save()
+        self.assertNotContains(self.guest_client.get(url), "Текст поста")
+
+    def test_follow_invalidates_profile(self):
+        """Подписка сбрасывает страницу профиля автора"""
+        url = reverse("profile", args=[self.user.username])
+        self.guest_client.get(url)
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertContains(self.guest_client.get(url), "Подписчиков: 1")
+
+    def test_deleting_user_without_posts_invalidates_profile(self):
+        """Удаление пользователя без постов сбрасывает его профиль"""
+        url = reverse("profile", args=[self.reader.username])
+        self.guest_client.get(url)
+        self.reader.delete()
+        self.assertEqual(self.guest_client.get(url).status_code, 404)
+
+    def test_deleting_group_invalidates_group_page(self):
+        """Удаление группы сбрасывает ее страницу"""
+        url = reverse("group_posts", args=[self.group.slug])
+        self.guest_client.get(url)
+        self.group.delete()
+        self.assertEqual(self.guest_client.get(url).status_code, 404)
+
+    def test_authorized_user_is_not_cached(self):
+        """Авторизованный пользователь всегда получает свежую страницу"""
+        client = Client()
+        client.force_login(self.reader)
+        client.get(self.urls[0])
+        # bulk_create не вызывает сигналов и не сбрасывает счетчики
+        Post.objects.bulk_create([Post(text="Без сигналов", author=self.user)])
+        self.assertContains(client.get(self.urls[0]), "Без сигналов")
+
+
+class StampedeProtectionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+
+    def test_stats_count_hits_and_misses(self):
+        """Счетчики фиксируют промах и попадание"""
+        get_or_compute("key", lambda: "value", 60)
+        self.assertEqual(get_or_compute("key", lambda: "other", 60), "value")
+        stats = cache_stats()
+        self.assertEqual((stats["miss"], stats["hit"]), (1, 1))
+
+    def test_expired_value_is_served_stale_while_locked(self):
+        """Пока другой процесс пересчитывает, отдается устаревшее значение"""
+        get_or_compute("key", lambda: "old", -1)
+        cache.add("lock:key", 1)
+        self.assertEqual(get_or_compute("key", lambda: "new", 60), "old")
+        self.assertEqual(cache_stats()["stale"], 1)
+
+    def test_expired_value_is_recomputed_by_lock_holder(self):
+        """Взявший блокировку пересчитывает устаревшее значение"""
+        get_or_compute("key", lambda: "old", -1)
+        self.assertEqual(get_or_compute("key", lambda: "new", 60), "new")
+        self.assertIsNone(cache.get("lock:key"))
+
+    @override_settings(CACHE_EARLY_RECOMPUTE_BETA=10 ** 9)
+    def test_early_recompute(self):
+        """Значение пересчитывается до срока, если расчет долгий"""
+        get_or_compute("key", lambda: time.sleep(0.01) or "old", 60)
+        self.assertEqual(get_or_compute("key", lambda: "new", 60), "new")
+        self.assertEqual(cache_stats()["early"], 1)
+
+    def test_missing_value_is_computed_once(self):
+        """При промахе ожидающие получают результат единственного расчета"""
+        cache.add("lock:key", 1)
+        calls = []
+
+        def finish():
+            time.sleep(0.1)
+            cache.set("key", ("value", time.time() + 60, 0), 60)
+
+        thread = threading.Thread(target=finish)
+        thread.start()
+        value = get_or_compute("key", lambda: calls.append(1) or "x", 60)
+        thread.join()
+        self.assertEqual(value, "value")
+        self.assertEqual(calls, [])
+        self.assertGreater(cache_stats()["lock_wait"], 0)
+
+
+class LocalCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        reset_cache_stats()
+
+    def test_fragments_are_served_from_process_memory(self):
+        """Повторное чтение фрагмента не обращается к общему кэшу"""
+        get_many_or_compute({"fragment": lambda: "value"}, 60)
+        cache.delete("fragment")
+        result = get_many_or_compute({"fragment": lambda: "other"}, 60)
+        self.assertEqual(result, {"fragment": "value"})
+        self.assertEqual(cache_stats()["local"], 1)
+
+    def test_epoch_change_drops_local_generations(self):
+        """Сдвиг эпохи другим процессом сбрасывает локальные счетчики
+        поколений в начале следующего запроса"""
+        author = User.objects.create(username="Sergey")
+        Post.objects.create(text="Первый пост", author=author)
+        client = Client()
+        url = reverse("index")
+        client.get(url)
+        old = get_generations(["index"])[0]
+        # Так выглядит запись из другого процесса: локальный кэш этого
+        # процесса о ней не знает
+        Post.objects.bulk_create([Post(text="Второй пост", author=author)])
+        cache.incr("generation:index")
+        cache.incr("generation:surrogate:index")
+        self.assertEqual(get_generations(["index"]), [old])
+        self.assertNotContains(client.get(url), "Второй пост")
+        cache.incr("local_cache:epoch")
+        self.assertContains(client.get(url), "Второй пост")
+        self.assertEqual(get_generations(["index"]), [old + 1])
@@ -0,0 +1,68 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.cards import card_key
+from posts.models import Group, Post, User
+
+
+class PostCardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username="Sergey")
+        self.reader = User.objects.create(username="Oleg")
+        self.group = Group.objects.create(
+            title="Заголовок",
+            slug="test-slug",
+            description="Текст",
+        )
+        self.post = Post.objects.create(
+            text="Текст поста", author=self.author, group=self.group)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.edit_url = reverse(
+            "post_edit", args=[self.author.username, self.post.id])
+
+    def get_index(self, client):
+        return client.get(reverse("index")).content.decode()
+
+    def test_one_card_serves_every_viewer(self):
+        """Кэшированная карточка персонализируется для каждого зрителя"""
+        self.assertIn(self.edit_url, self.get_index(self.author_client))
+        self.assertIsNotNone(cache.get(card_key(self.post)))
+        reader_page = self.get_index(self.reader_client)
+        self.assertNotIn(self.edit_url, reader_page)
+        self.assertIn("Добавить комментарий", reader_page)
+        self.assertNotIn("Добавить комментарий", self.get_index(Client()))
+
+    def test_edit_and_comment_bump_version(self):
+        """Редактирование и комментарий меняют версию карточки"""
+        self.get_index(Client())
+        self.author_client.post(self.edit_url, {"text": "Новый текст"})
+        self.assertIn("Новый текст", self.get_index(Client()))
+        self.reader_client.post(
+            reverse("add_comment", args=[self.author.username, self.post.id]),
+            {"text": "Комментарий"},
+        )
+        self.assertIn("Комментариев", self.get_index(Client()))
+
+    def test_group_and_author_changes_bump_version(self):
+        """Изменение группы или имени автора сбрасывает карточки"""
+        self.get_index(Client())
+        self.group.title = "Новая группа"
+        self.group.save()
+        self.assertIn("Новая группа", self.get_index(Client()))
+        self.author.username = "Sergey2"
+        self.author.save()
+        self.assertIn("@Sergey2", self.get_index(Client()))
+
+    def test_group_deletion_bumps_version(self):
+        """Удаление группы сбрасывает карточки ее постов"""
+        group_url = reverse("group_posts", args=[self.group.slug])
+        self.assertIn(group_url, self.get_index(Client()))
+        version = Post.objects.get(pk=self.post.pk).version
+        self.group.delete()
+        self.assertGreater(Post.objects.get(pk=self.post.pk).version, version)
+        self.assertNotIn(group_url, self.get_index(Client()))
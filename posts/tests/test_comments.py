@@ -0,0 +1,91 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.caching import clear_local_cache
+from posts.models import Comment, Post, User
+from posts.views import COMMENTS_PER_PAGE
+
+
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="Sergey")
+        cls.post = Post.objects.create(text="Пост", author=cls.user)
+        cls.count = COMMENTS_PER_PAGE * 2 + 5
+        Comment.objects.bulk_create(
+            Comment(text=f"Комментарий {i}", author=cls.user, post=cls.post)
+            for i in range(cls.count)
+        )
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.client = Client()
+
+    def ids(self, response):
+        return re.findall(r'name="comment_(\d+)"', response.content.decode())
+
+    def test_comments_are_loaded_in_pages(self):
+        """Страница поста выводит первую порцию комментариев, а фрагмент
+        отдает следующие без разметки страницы, пока они не кончатся"""
+        response = self.client.get(
+            reverse("post", args=[self.user.username, self.post.id]))
+        seen = self.ids(response)
+        self.assertEqual(len(seen), COMMENTS_PER_PAGE)
+        pages = 1
+        while True:
+            match = re.search(
+                r'data-fragment="([^"]+)"', response.content.decode())
+            if not match:
+                break
+            response = self.client.get(match.group(1).replace("&amp;", "&"))
+            self.assertNotContains(response, "<html")
+            seen += self.ids(response)
+            pages += 1
+        self.assertEqual(pages, 3)
+        expected = Comment.objects.order_by(
+            "-created", "-id").values_list("id", flat=True)
+        self.assertEqual([int(pk) for pk in seen], list(expected))
+
+    def test_fallback_link(self):
+        """Без скриптов ссылка ведет на страницу поста со следующими
+        комментариями"""
+        url = reverse("post", args=[self.user.username, self.post.id])
+        response = self.client.get(url)
+        link = re.search(
+            r'href="(/[^"]+\?after=[^"]+)"', response.content.decode())
+        response = self.client.get(link.group(1))
+        self.assertEqual(len(self.ids(response)), COMMENTS_PER_PAGE)
+        self.assertNotEqual(
+            self.ids(response)[0], self.ids(self.client.get(url))[0])
+
+    def test_context_comments_are_current_page(self):
+        """В контексте только комментарии выведенной страницы"""
+        response = self.client.get(
+            reverse("post", args=[self.user.username, self.post.id]))
+        self.assertEqual(
+            list(response.context["comments"]),
+            list(response.context["comment_page"]),
+        )
+
+
+class CommentCascadeTest(TestCase):
+    def delete_post(self, comments):
+        user = User.objects.create(username=f"user{comments}")
+        post = Post.objects.create(text="Пост", author=user)
+        for i in range(comments):
+            Comment.objects.create(text=f"Комментарий {i}", author=user,
+                                   post=post)
+        with CaptureQueriesContext(connection) as queries:
+            post.delete()
+        return len(queries)
+
+    def test_post_deletion_does_not_touch_each_comment(self):
+        """Удаление поста не обрабатывает каждый комментарий отдельно:
+        число запросов не зависит от числа комментариев"""
+        self.assertEqual(self.delete_post(2), self.delete_post(20))
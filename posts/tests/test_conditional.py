@@ -0,0 +1,86 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+
+from posts.caching import clear_local_cache
+from posts.models import Comment, Group, Post, User
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.user = User.objects.create(username="Sergey")
+        self.group = Group.objects.create(
+            title="Заголовок",
+            slug="test-slug",
+            description="Текст",
+        )
+        self.post = Post.objects.create(
+            text="Текст поста", author=self.user, group=self.group)
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.urls = [
+            reverse("index"),
+            reverse("group_posts", args=[self.group.slug]),
+            reverse("profile", args=[self.user.username]),
+            reverse("post", args=[self.user.username, self.post.id]),
+        ]
+
+    def test_unchanged_page_is_not_modified(self):
+        """Повторный запрос с ETag получает 304 без рендеринга"""
+        for client in (self.guest_client, self.authorized_client):
+            for url in self.urls:
+                with self.subTest(url=url):
+                    etag = client.get(url)["ETag"]
+                    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 304)
+                    self.assertEqual(response.templates, [])
+
+    def test_if_modified_since_is_ignored(self):
+        """Last-Modified не отдается, и If-Modified-Since не дает 304
+        ни после правки поста, ни другому зрителю"""
+        url = self.urls[-1]
+        response = self.guest_client.get(url)
+        self.assertFalse(response.has_header("Last-Modified"))
+        since = http_date()
+        self.post.text = "Новый текст"
+        self.post.save()
+        for client in (self.guest_client, self.authorized_client):
+            response = client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_viewer(self):
+        """Гость и автор видят разные страницы и получают разные ETag"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertNotEqual(
+                    self.guest_client.get(url)["ETag"],
+                    self.authorized_client.get(url)["ETag"],
+                )
+
+    def test_changes_update_etag(self):
+        """Комментарий и правка поста меняют ETag всех страниц с постом"""
+        etags = {url: self.guest_client.get(url)["ETag"] for url in self.urls}
+        Comment.objects.create(text="Текст", author=self.user, post=self.post)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                etags[url] = response["ETag"]
+        self.post.text = "Новый текст"
+        self.post.save()
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertContains(response, "Новый текст")
+
+    def test_missing_page_is_not_found(self):
+        """Для несуществующей страницы проверка не мешает ответу 404"""
+        response = self.guest_client.get(
+            reverse("profile", args=["nobody"]), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 404)
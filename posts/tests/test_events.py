@@ -0,0 +1,111 @@
+from unittest import mock
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import events
+from posts.models import Follow, Group, Post, User
+
+
+@override_settings(EVENTS_POLL_INTERVAL=0, EVENTS_HEARTBEAT=0.05,
+                   EVENTS_MAX_AGE=60)
+class EventStreamTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="Sergey")
+        cls.author = User.objects.create(username="Oleg")
+        cls.stranger = User.objects.create(username="Ivan")
+        cls.group = Group.objects.create(
+            title="Заголовок", slug="test-slug", description="Текст")
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        # Id постов в тестах повторяются после отката транзакции
+        patcher = mock.patch.object(events, "broker", events.Broker())
+        self.broker = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def open(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.addCleanup(response.close)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = (chunk.decode() for chunk in response.streaming_content)
+        self.assertTrue(next(chunks).startswith("retry:"))
+        return chunks
+
+    def test_group_stream(self):
+        """Поток группы сообщает только о постах этой группы"""
+        chunks = self.open(reverse("group_events", args=[self.group.slug]))
+        Post.objects.create(text="Без группы", author=self.author)
+        post = Post.objects.create(
+            text="Пост", author=self.stranger, group=self.group)
+        chunk = next(chunks)
+        self.assertIn(f"id: {post.id}\nevent: post\n", chunk)
+        self.assertIn(reverse("post", args=["Ivan", post.id]), chunk)
+        self.assertEqual(chunk.count("event: post"), 1)
+
+    def test_follow_stream(self):
+        """Поток подписок сообщает только о постах авторов из подписок"""
+        chunks = self.open(reverse("follow_events"))
+        Post.objects.create(text="Чужой пост", author=self.stranger)
+        post = Post.objects.create(text="Пост", author=self.author)
+        chunk = next(chunks)
+        self.assertIn(f"id: {post.id}\n", chunk)
+        self.assertEqual(chunk.count("event: post"), 1)
+
+    def test_heartbeat(self):
+        """Без событий поток шлет комментарий с просмотренным id"""
+        post = Post.objects.create(text="Пост", author=self.stranger)
+        chunks = self.open(reverse("follow_events"))
+        self.assertEqual(next(chunks), f": ping\nid: {post.id}\n\n")
+
+    def test_resume(self):
+        """Переподключение с Last-Event-ID получает пропущенные посты"""
+        first = Post.objects.create(text="Первый", author=self.author)
+        missed = [
+            Post.objects.create(text=f"Пост {i}", author=self.author)
+            for i in range(2)
+        ]
+        chunks = self.open(
+            reverse("follow_events"), HTTP_LAST_EVENT_ID=str(first.id))
+        chunk = next(chunks)
+        for post in missed:
+            self.assertIn(f"id: {post.id}\n", chunk)
+        self.assertNotIn(f"id: {first.id}\n", chunk)
+
+    @override_settings(EVENTS_MAX_CONNECTIONS=1)
+    def test_connection_cap(self):
+        """Сверх предела соединений клиенту предлагается переподключиться
+        позже, а закрытое соединение освобождает место"""
+        url = reverse("group_events", args=[self.group.slug])
+        response = self.client.get(url)
+        next(iter(response.streaming_content))
+        busy = self.client.get(url)
+        self.assertEqual(busy.status_code, 200)
+        self.assertEqual(
+            b"".join(busy.streaming_content), b"retry: 30000\n\n")
+        response.close()
+        self.assertEqual(self.broker.connections, 0)
+        self.open(url)
+
+    def test_guests_do_not_open_streams(self):
+        """Гостю поток не нужен: страница группы его не открывает, а
+        сам поток требует входа"""
+        guest = Client()
+        group_url = reverse("group_posts", args=[self.group.slug])
+        events_url = reverse("group_events", args=[self.group.slug])
+        self.assertNotContains(guest.get(group_url), events_url)
+        self.assertContains(self.client.get(group_url), events_url)
+        self.assertEqual(guest.get(events_url).status_code, 302)
+
+    @override_settings(EVENTS_POLL_INTERVAL=60)
+    def test_new_post_is_published(self):
+        """Новый пост будит подписчиков, не дожидаясь опроса базы"""
+        chunks = self.open(reverse("follow_events"))
+        author = Client()
+        author.force_login(self.author)
+        author.post(reverse("new_post"), {"text": "Новый пост"})
+        post = Post.objects.get(text="Новый пост")
+        self.assertIn(f"id: {post.id}\n", next(chunks))
@@ -0,0 +1,96 @@
+import re
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.caching import clear_local_cache
+from posts.models import Follow, Group, Post, User
+
+
+class FeedFragmentTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="Sergey")
+        cls.author = User.objects.create(username="Oleg")
+        cls.group = Group.objects.create(
+            title="Заголовок", slug="test-slug", description="Текст")
+        Follow.objects.create(user=cls.user, author=cls.author)
+        # Посты создаются по одному: ленту подписок заполняют сигналы
+        for i in range(23):
+            Post.objects.create(
+                text=f"Пост {i}", author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def ids(self, response):
+        return re.findall(r'name="post_(\d+)"', response.content.decode())
+
+    def feeds(self):
+        return {
+            "index": (reverse("index"), 10),
+            "group_posts": (reverse("group_posts", args=[self.group.slug]),
+                            10),
+            "profile": (reverse("profile", args=[self.author.username]), 5),
+            "follow_index": (reverse("follow_index"), 5),
+        }
+
+    def test_feeds_are_loaded_in_fragments(self):
+        """Полная страница выводит первую порцию постов, а фрагменты -
+        следующие, без разметки страницы, пока посты не кончатся"""
+        expected = [str(pk) for pk in Post.objects.order_by(
+            "-pub_date", "-id").values_list("id", flat=True)]
+        for name, (url, per_page) in self.feeds().items():
+            with self.subTest(name=name):
+                response = self.client.get(url)
+                seen = self.ids(response)
+                self.assertEqual(len(seen), per_page)
+                while True:
+                    match = re.search(
+                        r'data-fragment="([^"]+)"', response.content.decode())
+                    if not match:
+                        self.assertFalse(response.has_header("X-Next-Cursor"))
+                        break
+                    fragment = match.group(1).replace("&amp;", "&")
+                    self.assertTrue(fragment.endswith(
+                        "after=" + response["X-Next-Cursor"]))
+                    response = self.client.get(fragment)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotContains(response, "<html")
+                    seen += self.ids(response)
+                self.assertEqual(seen, expected)
+
+    def test_fallback_link(self):
+        """Без скриптов ссылка открывает полную страницу со следующими
+        постами"""
+        for name, (url, per_page) in self.feeds().items():
+            with self.subTest(name=name):
+                response = self.client.get(url)
+                link = re.search(
+                    r'href="(\?after=[^"]+)"', response.content.decode())
+                following = self.client.get(url + link.group(1))
+                self.assertContains(following, "<html")
+                self.assertEqual(
+                    self.ids(following),
+                    self.ids(self.client.get(
+                        re.search(r'data-fragment="([^"]+)"',
+                                  response.content.decode()).group(1)
+                    ))[:per_page],
+                )
+
+    def test_anonymous_fragment_is_cached_separately(self):
+        """Фрагмент и полная страница кэшируются под разными ключами"""
+        self.client.logout()
+        url = reverse("group_posts", args=[self.group.slug])
+        fragment = reverse("group_posts_fragment", args=[self.group.slug])
+        self.assertContains(self.client.get(url), "<html")
+        response = self.client.get(fragment)
+        self.assertNotContains(response, "<html")
+        self.assertIn(f"group-{self.group.pk}", response["Surrogate-Key"])
+        cached = self.client.get(fragment)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached["X-Next-Cursor"], response["X-Next-Cursor"])
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -66,10 +67,12 @@ class CreateFormTests(TestCase):
         )
         self.assertRedirects(response, reverse('index'))
         self.assertEqual(Post.objects.count(), posts_count + 1)
+        # Файлы называются по хешу содержимого
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertTrue(Post.objects.filter(
             text='Новый пост',
             group=self.group.id,
-            image='posts/small.gif').exists()
+            image=f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif').exists()
         )
 
     def test_edit_post(self):
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.media import RangeNotSatisfiable, parse_range
+
+MEDIA_ROOT = tempfile.mkdtemp()
+HASHED_NAME = "posts/ab/cd/abcd" + "0" * 60 + ".txt"
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MediaServeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ("posts/plain.txt", HASHED_NAME, "posts/.hidden"):
+            path = os.path.join(MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(b"0123456789")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+
+    def get(self, name, **headers):
+        return self.client.get(
+            reverse("media", args=[name]), **headers)
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_file(self):
+        """Файл отдается целиком с ETag и проверкой по нему"""
+        response = self.get("posts/plain.txt")
+        self.assertEqual(self.content(response), b"0123456789")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("no-cache", response["Cache-Control"])
+        response = self.get(
+            "posts/plain.txt", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_hashed_name_is_immutable(self):
+        """Файл с именем по хешу кешируется навсегда, ETag - хеш"""
+        response = self.get(HASHED_NAME)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+        self.assertEqual(response["ETag"], '"abcd' + "0" * 60 + '"')
+
+    def test_range(self):
+        """Диапазон отдается с кодом 206 и Content-Range"""
+        response = self.get("posts/plain.txt", HTTP_RANGE="bytes=2-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), b"234")
+        self.assertEqual(response["Content-Range"], "bytes 2-4/10")
+        self.assertEqual(response["Content-Length"], "3")
+
+    def test_range_not_satisfiable(self):
+        response = self.get("posts/plain.txt", HTTP_RANGE="bytes=20-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_stale_if_range_returns_whole_file(self):
+        """При изменившемся файле If-Range отменяет диапазон"""
+        response = self.get(
+            "posts/plain.txt", HTTP_RANGE="bytes=2-4",
+            HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), b"0123456789")
+
+    def test_forbidden_names(self):
+        """Скрытые файлы, выход за MEDIA_ROOT и записи не отдаются"""
+        self.assertEqual(self.get("posts/.hidden").status_code, 404)
+        self.assertEqual(self.get("../settings.py").status_code, 404)
+        self.assertEqual(self.get("posts/missing.txt").status_code, 404)
+        response = self.client.post(reverse("media", args=["posts/a.txt"]))
+        self.assertEqual(response.status_code, 405)
+
+    @override_settings(MEDIA_SENDFILE="x-accel-redirect")
+    def test_x_accel_redirect(self):
+        """Передача файла отдается nginx"""
+        response = self.get("posts/plain.txt")
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/posts/plain.txt")
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["Content-Type"], "text/plain")
+
+    @override_settings(MEDIA_SENDFILE="x-sendfile")
+    def test_x_sendfile(self):
+        response = self.get("posts/plain.txt")
+        self.assertEqual(
+            response["X-Sendfile"],
+            os.path.join(MEDIA_ROOT, "posts", "plain.txt"))
+        last_modified = response["Last-Modified"]
+        response = self.get(
+            "posts/plain.txt", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class ParseRangeTest(TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range("bytes=0-", 10), (0, 9))
+        self.assertEqual(parse_range("bytes=5-100", 10), (5, 9))
+        self.assertEqual(parse_range("bytes=-3", 10), (7, 9))
+        self.assertIsNone(parse_range("bytes=0-1,3-4", 10))
+        self.assertIsNone(parse_range("items=0-1", 10))
+        self.assertIsNone(parse_range("bytes=5-2", 10))
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=10-", 10)
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import thumbnails
+from posts.caching import clear_local_cache
+from posts.models import Post, User
+
+from .test_thumbnails import image_file
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0,
+                   IMAGE_PROCESSES=0)
+class CollectOrphanedMediaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.addCleanup(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
+        user = User.objects.create(username="Sergey")
+        client = Client()
+        client.force_login(user)
+        client.post(reverse("new_post"), {
+            "text": "Пост", "image": image_file("image.png")})
+        post = Post.objects.get(text="Пост")
+        self.referenced = [
+            post.image.name, *thumbnails.variant_names(post.thumbnail_data)]
+        self.orphans = ["posts/old.jpg", "cache/ab/cd/thumbnail.jpg"]
+        for name in self.orphans + ["posts/fresh.jpg"]:
+            self.write(name)
+        for name in self.referenced + self.orphans:
+            past = time.time() - 2 * 60 * 60
+            os.utime(self.path(name), (past, past))
+
+    def path(self, name):
+        return os.path.join(MEDIA_ROOT, name)
+
+    def write(self, name):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        with open(self.path(name), "wb") as file:
+            file.write(b"x" * 10)
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command("collect_orphaned_media", *args, "--batch-size=2",
+                     stdout=out)
+        return out.getvalue()
+
+    def exists(self, names, root=MEDIA_ROOT):
+        return [os.path.exists(os.path.join(root, n)) for n in names]
+
+    def test_dry_run(self):
+        """Пробный запуск только считает файлы без ссылок"""
+        output = self.collect("--dry-run")
+        self.assertIn("Можно освободить: 2 файлов, 20\xa0байт", output)
+        self.assertIn("Проверено файлов: 2,", output)
+        self.assertTrue(all(self.exists(self.orphans)))
+
+    def test_delete(self):
+        """Удаляются старые файлы без ссылок, остальные остаются"""
+        self.collect()
+        self.assertFalse(any(self.exists(self.orphans)))
+        self.assertTrue(all(self.exists(
+            self.referenced + ["posts/fresh.jpg"])))
+
+    def test_quarantine(self):
+        """Файлы переносятся в карантин с сохранением путей"""
+        quarantine = os.path.join(MEDIA_ROOT, "quarantine")
+        self.collect(f"--quarantine={quarantine}")
+        self.assertFalse(any(self.exists(self.orphans)))
+        self.assertTrue(all(self.exists(self.orphans, quarantine)))
+        # Карантин при повторном запуске не обходится
+        self.assertIn("Перенесено в карантин: 0 файлов",
+                      self.collect(f"--quarantine={quarantine}"))
@@ -0,0 +1,81 @@
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+from posts.paginator import CursorPaginator, decode_cursor
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username="Sergey")
+        cls.group = Group.objects.create(
+            title="Заголовок",
+            slug="test-slug",
+            description="Текст",
+        )
+        Post.objects.bulk_create(
+            Post(text=f"Пост {i}", author=cls.user, group=cls.group)
+            for i in range(25)
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_pages_cover_whole_archive(self):
+        """Курсоры ?after= проходят все посты без пропусков и повторов"""
+        seen = []
+        after = None
+        while True:
+            page = CursorPaginator(Post.objects.all(), 10).get_page(after)
+            seen.extend(page.object_list)
+            if not page.has_next():
+                break
+            after = page.next_cursor
+        expected = list(Post.objects.order_by("-pub_date", "-id"))
+        self.assertEqual(seen, expected)
+
+    def test_before_returns_previous_page(self):
+        """Курсор ?before= возвращает предыдущую страницу"""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        first = paginator.get_page()
+        second = paginator.get_page(after=first.next_cursor)
+        back = paginator.get_page(before=second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_number_api_uses_cursors(self):
+        """Номерной API Paginator работает на курсорах и не считает
+        COUNT(*)"""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        with CaptureQueriesContext(connection) as queries:
+            first = paginator.page(None)
+            second = paginator.page(first.next_page_number())
+            self.assertIsNone(paginator.num_pages)
+            self.assertEqual(list(paginator.page_range), [])
+            self.assertIsNone(second.start_index())
+            self.assertIsNone(second.end_index())
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(
+            list(second), list(paginator.get_page(after=first.next_cursor)))
+        back = paginator.get_page(before=second.previous_page_number())
+        self.assertEqual(list(back), list(first))
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный токен отдает первую страницу"""
+        self.assertIsNone(decode_cursor("not-a-cursor"))
+        response = self.guest_client.get(reverse("index"), {"after": "x!"})
+        self.assertFalse(response.context["page"].has_previous())
+
+    def test_deep_page_has_same_query_count(self):
+        """Глубокая страница стоит столько же запросов, сколько первая"""
+        url = reverse("group_posts", kwargs={"slug": "test-slug"})
+        with CaptureQueriesContext(connection) as first:
+            response = self.guest_client.get(url)
+        cursor = response.context["page"].next_cursor
+        with self.assertNumQueries(len(first.captured_queries)):
+            self.guest_client.get(url, {"after": cursor})
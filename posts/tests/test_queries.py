@@ -0,0 +1,79 @@
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class FeedQueryBudgetTest(TestCase):
+    """Число запросов ленты не зависит от числа постов на странице"""
+
+    # Бюджет запросов на страницу ленты для авторизованного пользователя,
+    # включая расчет ETag (posts/conditional.py)
+    BUDGETS = {
+        "index": 4,
+        "group_posts": 6,
+        "profile": 8,
+        "follow_index": 4,
+        "index_fragment": 4,
+        "group_posts_fragment": 6,
+        "profile_fragment": 8,
+        "follow_index_fragment": 4,
+        "post": 6,
+        "post_comments": 6,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username="Sergey")
+        cls.author = User.objects.create(username="Oleg")
+        cls.group = Group.objects.create(
+            title="Заголовок",
+            slug="test-slug",
+            description="Текст",
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for i in range(12):
+            post = Post.objects.create(
+                text=f"Пост {i}", author=cls.author, group=cls.group)
+            comment = Comment.objects.create(
+                text="Комментарий", author=cls.user, post=post)
+        Comment.objects.create(
+            text="Ответ", author=cls.author, post=post, parent=comment)
+        cls.post = post
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def urls(self):
+        return {
+            "index": reverse("index"),
+            "group_posts": reverse("group_posts", args=[self.group.slug]),
+            "profile": reverse("profile", args=[self.author.username]),
+            "follow_index": reverse("follow_index"),
+            "index_fragment": reverse("index_fragment"),
+            "group_posts_fragment": reverse(
+                "group_posts_fragment", args=[self.group.slug]),
+            "profile_fragment": reverse(
+                "profile_fragment", args=[self.author.username]),
+            "follow_index_fragment": reverse("follow_index_fragment"),
+            "post": reverse("post", args=[self.author.username,
+                                          self.post.id]),
+            "post_comments": reverse(
+                "post_comments", args=[self.author.username, self.post.id]),
+        }
+
+    def test_feed_query_budgets(self):
+        """Ленты укладываются в бюджет запросов"""
+        for name, url in self.urls().items():
+            with self.subTest(name=name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.authorized_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    len(queries), self.BUDGETS[name],
+                    "\n".join(query["sql"] for query in queries),
+                )
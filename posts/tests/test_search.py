@@ -0,0 +1,98 @@
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+
+from posts.caching import clear_local_cache
+from posts.models import Group, Post, User
+from posts.search import SearchPaginator, to_match
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.author = User.objects.create(username="Sergey")
+        self.other = User.objects.create(username="Ivan")
+        self.group = Group.objects.create(
+            title="Коты", slug="cats", description="Коты")
+        self.client = Client()
+
+    def search(self, **params):
+        return self.client.get(reverse("search"), params)
+
+    def test_to_match(self):
+        """Операторы FTS5 в запросе экранируются"""
+        self.assertEqual(to_match('Ёжик AND "кот*'), '"Ежик"* "AND"* "кот"*')
+        self.assertEqual(to_match("  !? "), "")
+
+    def test_ranked_results(self):
+        """Находятся посты со всеми словами, сначала более релевантные,
+        слова ищутся по началу и без различия е и ё"""
+        Post.objects.create(text="Собака лает", author=self.author)
+        weak = Post.objects.create(
+            text="Кот сидел на окне, а рядом стоял длинный шкаф с книгами "
+                 "и лампа, и много других слов",
+            author=self.author)
+        strong = Post.objects.create(
+            text="Кот котам кот", author=self.author)
+        posts = list(self.search(q="кот").context["page"])
+        self.assertEqual(posts, [strong, weak])
+        Post.objects.create(text="Ёлка у дома", author=self.author)
+        self.assertEqual(len(self.search(q="елк").context["page"]), 1)
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке и удалении поста"""
+        post = Post.objects.create(text="Старый текст", author=self.author)
+        post.text = "Новый текст"
+        post.save()
+        self.assertFalse(self.search(q="старый").context["page"])
+        self.assertEqual(list(self.search(q="новый").context["page"]), [post])
+        post.delete()
+        self.assertFalse(self.search(q="новый").context["page"])
+
+    def test_filters(self):
+        """Результаты фильтруются по группе и автору"""
+        in_group = Post.objects.create(
+            text="Кот", author=self.author, group=self.group)
+        by_other = Post.objects.create(text="Кот", author=self.other)
+        page = self.search(q="кот", group="cats").context["page"]
+        self.assertEqual(list(page), [in_group])
+        page = self.search(q="кот", author="Ivan").context["page"]
+        self.assertEqual(list(page), [by_other])
+        response = self.search(q="кот", author="Nobody")
+        self.assertIsNone(response.context["page"])
+        self.assertTrue(response.context["form"].errors["author"])
+
+    def test_keyset_pagination(self):
+        """Курсоры обходят все результаты без пропусков и повторов,
+        ссылки сохраняют запрос"""
+        posts = [
+            Post.objects.create(text="кот " * (i % 3 + 1), author=self.author)
+            for i in range(25)
+        ]
+        paginator = SearchPaginator("кот", 10)
+        seen, page = [], paginator.get_page()
+        while True:
+            seen.extend(page)
+            if not page.has_next():
+                break
+            page = paginator.get_page(after=page.next_cursor)
+        self.assertCountEqual(seen, posts)
+        self.assertEqual(len(set(seen)), 25)
+        scores = [post.score for post in seen]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        previous = paginator.get_page(before=page.previous_cursor)
+        self.assertEqual(list(previous), seen[10:20])
+        response = self.search(q="кот")
+        self.assertContains(response, "?q=%D0%BA%D0%BE%D1%82&amp;after=")
+
+    def test_admin_search(self):
+        """Поиск в админке идет через индекс"""
+        post = Post.objects.create(text="Кот", author=self.author)
+        Post.objects.create(text="Собака", author=self.author)
+        model_admin = site._registry[Post]
+        queryset, use_distinct = model_admin.get_search_results(
+            RequestFactory().get("/"), Post.objects.all(), "кот")
+        self.assertEqual(list(queryset), [post])
+        self.assertIn("posts_post_fts", str(queryset.query))
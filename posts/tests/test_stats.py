@@ -0,0 +1,94 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Post, User, UserStats
+
+
+class UserStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="Sergey")
+        self.author = User.objects.create(username="Oleg")
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        """Счетчики меняются при создании и удалении постов и подписок"""
+        post = Post.objects.create(text="Текст", author=self.author)
+        self.client.get(reverse("profile_follow", args=[self.author]))
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        post.delete()
+        self.client.get(reverse("profile_unfollow", args=[self.author]))
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.user).following_count, 0)
+
+    def test_cascade_user_delete(self):
+        """Удаление пользователя уменьшает счетчики его авторов"""
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text="Текст", author=self.user)
+        self.user.delete()
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount исправляет разошедшиеся счетчики"""
+        Post.objects.bulk_create([Post(text="Текст", author=self.author)])
+        call_command("recount", stdout=StringIO())
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+
+    def test_profile_reads_stats(self):
+        """Страница профиля показывает счетчики из строки статистики"""
+        Post.objects.create(text="Текст", author=self.author)
+        response = self.client.get(reverse("profile", args=[self.author]))
+        self.assertEqual(response.context["stats"].posts_count, 1)
+
+
+class CommentCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="Sergey")
+        self.post = Post.objects.create(text="Текст", author=self.user)
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def comment_count(self):
+        return Post.objects.get(pk=self.post.pk).comment_count
+
+    def test_add_comment_increments(self):
+        """add_comment увеличивает comment_count, удаление уменьшает"""
+        self.client.post(
+            reverse("add_comment", args=[self.user, self.post.id]),
+            {"text": "Комментарий"},
+        )
+        self.assertEqual(self.comment_count(), 1)
+        Comment.objects.get().delete()
+        self.assertEqual(self.comment_count(), 0)
+
+    def test_cascade_from_author_delete(self):
+        """Удаление автора комментариев уменьшает comment_count"""
+        other = User.objects.create(username="Oleg")
+        Comment.objects.create(text="Текст", author=other, post=self.post)
+        other.delete()
+        self.assertEqual(self.comment_count(), 0)
+
+    def test_edit_does_not_overwrite_count(self):
+        """Редактирование поста не затирает comment_count"""
+        stale = Post.objects.get(pk=self.post.pk)
+        Comment.objects.create(text="Текст", author=self.user, post=self.post)
+        stale.text = "Новый текст"
+        stale.save()
+        self.assertEqual(self.comment_count(), 1)
+
+    def test_recount_repairs_comment_count(self):
+        """Команда recount исправляет comment_count после bulk-операций"""
+        Comment.objects.bulk_create(
+            [Comment(text="Текст", author=self.user, post=self.post)])
+        call_command("recount", stdout=StringIO())
+        self.assertEqual(self.comment_count(), 1)
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from posts import thumbnails
+from posts.caching import clear_local_cache
+from posts.models import MediaFile, Post, User
+from posts.storage import is_content_addressed
+
+from .test_thumbnails import image_file
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0,
+                   IMAGE_PROCESSES=0)
+class ContentAddressedStorageTest(TransactionTestCase):
+    # Файлы удаляются после фиксации транзакции, TestCase ее не фиксирует
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.user = User.objects.create(username="Sergey")
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create(self, text, name="image.png", size=(50, 50)):
+        self.client.post(reverse("new_post"), {
+            "text": text, "image": image_file(name, size)})
+        return Post.objects.get(text=text)
+
+    def path(self, name):
+        return os.path.join(MEDIA_ROOT, name)
+
+    def test_identical_images_are_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом с двумя ссылками,
+        а варианты для второго поста не кодируются заново"""
+        first = self.create("Первый", "first.png")
+        with mock.patch.object(
+                thumbnails, "render", wraps=thumbnails.render) as render:
+            second = self.create("Второй", "second.png")
+        render.assert_not_called()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_content_addressed(first.image.name))
+        self.assertEqual(first.thumbnail_data, second.thumbnail_data)
+        self.assertEqual(MediaFile.objects.get(name=first.image.name).refs, 2)
+
+    def test_file_is_deleted_with_last_reference(self):
+        """Файл удаляется вместе с последним постом, который на него
+        ссылается"""
+        first = self.create("Первый")
+        second = self.create("Второй")
+        names = [first.image.name, *thumbnails.variant_names(
+            first.thumbnail_data)]
+        first.delete()
+        self.assertTrue(all(os.path.exists(self.path(n)) for n in names))
+        second.delete()
+        self.assertFalse(any(os.path.exists(self.path(n)) for n in names))
+        self.assertFalse(MediaFile.objects.exists())
+
+    def test_rollback_keeps_file(self):
+        """Откат удаления поста оставляет файл на диске"""
+        post = self.create("Пост")
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                post.delete()
+                raise RuntimeError
+        self.assertTrue(os.path.exists(self.path(post.image.name)))
+        self.assertEqual(MediaFile.objects.get(name=post.image.name).refs, 1)
+
+    def test_edit_releases_old_image(self):
+        """Замененная при правке картинка удаляется"""
+        post = self.create("Пост")
+        old = post.image.name
+        self.client.post(
+            reverse("post_edit", args=[self.user.username, post.id]),
+            {"text": "Пост", "image": image_file("new.png", (60, 60))},
+        )
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old)
+        self.assertFalse(os.path.exists(self.path(old)))
+        self.assertTrue(os.path.exists(self.path(post.image.name)))
+
+    def test_reuploading_same_image_keeps_one_reference(self):
+        """Повторная загрузка того же файла при правке не оставляет
+        лишней ссылки, и файл удаляется вместе с постом"""
+        post = self.create("Пост")
+        self.client.post(
+            reverse("post_edit", args=[self.user.username, post.id]),
+            {"text": "Пост", "image": image_file("image.png", (50, 50))},
+        )
+        post.refresh_from_db()
+        self.assertEqual(MediaFile.objects.get(name=post.image.name).refs, 1)
+        post.delete()
+        self.assertFalse(os.path.exists(self.path(post.image.name)))
+
+    def test_immutable_headers(self):
+        """Файлы с именами по хешу отдаются с кешированием навсегда"""
+        post = self.create("Пост")
+        response = self.client.get(post.image.url)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=31536000", response["Cache-Control"])
@@ -0,0 +1,110 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import surrogate, views
+from posts.caching import clear_local_cache
+from posts.models import Group, Post, User
+
+
+class SurrogateCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.user = User.objects.create(username="Sergey")
+        self.group = Group.objects.create(
+            title="Заголовок",
+            slug="test-slug",
+            description="Текст",
+        )
+        self.post = Post.objects.create(
+            text="Текст поста", author=self.user, group=self.group)
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.post_url = reverse(
+            "post", args=[self.user.username, self.post.id])
+        self.urls = [
+            reverse("index"),
+            reverse("group_posts", args=[self.group.slug]),
+            reverse("profile", args=[self.user.username]),
+            self.post_url,
+        ]
+
+    def test_headers(self):
+        """Гостевые страницы публичны и помечены ключами поста, автора
+        и группы, страницы пользователя - приватны"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIn("public", response["Cache-Control"])
+                self.assertIn("s-maxage", response["Cache-Control"])
+                self.assertIn("Cookie", response["Vary"])
+                self.assertLessEqual(
+                    {f"post-{self.post.id}", f"author-{self.user.id}",
+                     f"group-{self.group.id}"},
+                    set(response["Surrogate-Key"].split()),
+                )
+                response = self.authorized_client.get(url)
+                self.assertIn("private", response["Cache-Control"])
+
+    def test_repeated_request_is_served_by_proxy(self):
+        """Повторный запрос гостя отдает прокси, в том числе ответом 304"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)["ETag"]
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(url)
+                self.assertEqual(response["X-Cache"], "HIT")
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_writes_purge_dependent_pages(self):
+        """Новый пост, правка и комментарий очищают зависящие страницы"""
+        for url in self.urls:
+            self.guest_client.get(url)
+        self.authorized_client.post(
+            reverse("new_post"),
+            {"text": "Новый пост", "group": self.group.id},
+        )
+        for url in self.urls[:3]:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), "Новый пост")
+        self.authorized_client.post(
+            reverse("post_edit", args=[self.user.username, self.post.id]),
+            {"text": "Правка"},
+        )
+        self.assertContains(self.guest_client.get(self.post_url), "Правка")
+        self.authorized_client.post(
+            reverse("add_comment", args=[self.user.username, self.post.id]),
+            {"text": "Комментарий"},
+        )
+        self.assertContains(
+            self.guest_client.get(self.post_url), "Комментарий")
+
+    def test_session_bypasses_proxy(self):
+        """Запросы с сессией не попадают в общий кэш"""
+        self.guest_client.get(self.urls[0])
+        response = self.authorized_client.get(self.urls[0])
+        self.assertFalse(response.has_header("X-Cache"))
+
+    def test_purge_during_rendering(self):
+        """Страница, во время рендеринга которой очистили ключи, не
+        попадает в кэш прокси"""
+        render = views.render
+
+        def render_and_purge(*args, **kwargs):
+            response = render(*args, **kwargs)
+            surrogate.purge(f"post-{self.post.id}")
+            return response
+
+        url = self.urls[0]
+        with mock.patch.object(views, "render", render_and_purge):
+            self.guest_client.get(url)
+        response = self.guest_client.get(url)
+        self.assertFalse(response.has_header("X-Cache"))
+        response = self.guest_client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
@@ -0,0 +1,111 @@
+import re
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.caching import clear_local_cache
+from posts.models import Comment, Post, User
+from posts.threads import END
+
+
+@override_settings(COMMENT_THREAD_DEPTH=2, COMMENT_THREAD_REPLIES=200)
+class CommentThreadTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.user = User.objects.create(username="Sergey")
+        self.post = Post.objects.create(text="Пост", author=self.user)
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.url = reverse("post", args=[self.user.username, self.post.id])
+
+    def reply(self, parent=None, text="Ответ"):
+        return Comment.objects.create(
+            text=text, author=self.user, post=self.post, parent=parent)
+
+    def chain(self, length):
+        comments = [self.reply(text="Корень")]
+        for _ in range(length):
+            comments.append(self.reply(comments[-1]))
+        return comments
+
+    def ids(self, response):
+        return [int(pk) for pk in re.findall(
+            r'name="comment_(\d+)"', response.content.decode())]
+
+    def fragment(self, response):
+        match = re.search(r'data-fragment="([^"]+comments/\d+/[^"]*)"',
+                          response.content.decode())
+        return match and self.client.get(match.group(1).replace("&amp;", "&"))
+
+    def test_paths(self):
+        """Путь ответа продолжает путь родителя, поддерево - один
+        диапазон путей в порядке ветки"""
+        root = self.reply()
+        first = self.reply(root)
+        nested = self.reply(first)
+        second = self.reply(root)
+        other = self.reply()
+        nested.refresh_from_db()
+        self.assertEqual(nested.path, "".join(
+            Comment.segment(c.pk) for c in (root, first, nested)))
+        self.assertEqual(nested.depth, 2)
+        root.refresh_from_db()
+        self.assertEqual(root.reply_count, 2)
+        subtree = Comment.objects.filter(
+            post=self.post, path__gte=root.path, path__lt=root.path + END,
+        ).order_by("path")
+        self.assertEqual(list(subtree), [root, first, nested, second])
+        self.assertNotIn(other, subtree)
+
+    def test_depth_limit(self):
+        """Глубже предела ответы подгружаются по ссылке"""
+        comments = self.chain(5)
+        response = self.client.get(self.url)
+        self.assertEqual(self.ids(response), [c.pk for c in comments[:3]])
+        self.assertContains(response, "Ответов: 1")
+        response = self.fragment(response)
+        self.assertEqual(self.ids(response), [c.pk for c in comments[3:5]])
+        response = self.fragment(response)
+        self.assertEqual(self.ids(response), [comments[5].pk])
+        self.assertIsNone(self.fragment(response))
+
+    @override_settings(COMMENT_THREAD_REPLIES=3)
+    def test_replies_limit(self):
+        """После предела числа ответов ветка продолжается с места обрыва"""
+        root = self.reply(text="Корень")
+        replies = [self.reply(root) for _ in range(5)]
+        response = self.client.get(self.url)
+        self.assertEqual(self.ids(response), [root.pk] + [
+            reply.pk for reply in replies[:3]])
+        self.assertContains(response, "Показать еще ответы")
+        response = self.fragment(response)
+        self.assertEqual(self.ids(response), [r.pk for r in replies[3:]])
+
+    def test_add_reply(self):
+        """Ответ отправляется из формы с родителем, удаление ответа
+        уменьшает счетчик родителя"""
+        root = self.reply()
+        response = self.client.get(self.url, {"reply_to": root.pk})
+        self.assertContains(
+            response, f'name="parent" value="{root.pk}"')
+        self.client.post(
+            reverse("add_comment", args=[self.user.username, self.post.id]),
+            {"text": "Ответ на корень", "parent": root.pk},
+        )
+        reply = Comment.objects.get(text="Ответ на корень")
+        self.assertEqual(reply.parent, root)
+        root.refresh_from_db()
+        self.assertEqual(root.reply_count, 1)
+        reply.delete()
+        root.refresh_from_db()
+        self.assertEqual(root.reply_count, 0)
+
+    def test_delete_thread(self):
+        """Удаление комментария удаляет его ветку"""
+        comments = self.chain(3)
+        comments[1].delete()
+        self.assertEqual(list(Comment.objects.all()), [comments[0]])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
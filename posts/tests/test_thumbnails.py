@@ -0,0 +1,117 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from posts import thumbnails
+from posts.caching import clear_local_cache
+from posts.models import Post, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_file(name, size=(50, 50)):
+    buffer = BytesIO()
+    Image.new("RGB", size, (255, 0, 0)).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), "image/png")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0,
+                   IMAGE_PROCESSES=0)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.user = User.objects.create(username="Sergey")
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_upload_generates_variants(self):
+        """Картинка кодируется в WebP и JPEG нескольких ширин, а лента
+        строит <picture> из данных поста без обращений к хранилищу
+        миниатюр"""
+        self.client.post(reverse("new_post"), {
+            "text": "Пост с картинкой",
+            "image": image_file("first.png", (1000, 800)),
+        })
+        post = Post.objects.get(text="Пост с картинкой")
+        image = post.image_variants
+        self.assertEqual((image["width"], image["height"]), (960, 480))
+        self.assertEqual(
+            [source["type"] for source in image["sources"]],
+            ["image/webp", "image/jpeg"],
+        )
+        self.assertEqual(image["sources"][0]["srcset"].count("w,"), 2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("index"))
+        self.assertContains(response, image["sources"][0]["srcset"])
+        self.assertContains(response, 'width="960" height="480"')
+        self.assertFalse(any(
+            "thumbnail_kvstore" in query["sql"] for query in queries))
+
+    def test_small_image_is_not_upscaled(self):
+        """Маленькая картинка дает один вариант своей ширины"""
+        self.client.post(reverse("new_post"), {
+            "text": "Пост", "image": image_file("small.png")})
+        image = Post.objects.get(text="Пост").image_variants
+        self.assertEqual((image["width"], image["height"]), (50, 25))
+
+    def test_edit_replaces_variants(self):
+        """Новая картинка при правке получает свои варианты"""
+        self.client.post(reverse("new_post"), {
+            "text": "Пост", "image": image_file("first.png")})
+        post = Post.objects.get(text="Пост")
+        old = post.image_variants["fallback"]["src"]
+        self.client.post(
+            reverse("post_edit", args=[self.user.username, post.id]),
+            {"text": "Пост", "image": image_file("second.png", (60, 60))},
+        )
+        post.refresh_from_db()
+        new = post.image_variants["fallback"]["src"]
+        self.assertNotEqual(new, old)
+        self.assertContains(self.client.get(reverse("index")), new)
+
+    @override_settings(IMAGE_PROCESSES=1)
+    def test_process_pool(self):
+        """Кодирование в отдельном процессе дает те же варианты"""
+        self.client.post(reverse("new_post"), {
+            "text": "Пост", "image": image_file("pool.png", (700, 350))})
+        image = Post.objects.get(text="Пост").image_variants
+        self.assertEqual((image["width"], image["height"]), (700, 350))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=1,
+                   IMAGE_PROCESSES=0)
+class BackgroundThumbnailTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.user = User.objects.create(username="Sergey")
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_variants_are_prepared_after_commit(self):
+        """Фоновая подготовка заполняет варианты после ответа"""
+        self.client.post(reverse("new_post"), {
+            "text": "Пост", "image": image_file("background.png", (700, 350))})
+        thumbnails.wait_pending()
+        image = Post.objects.get(text="Пост").image_variants
+        self.assertEqual((image["width"], image["height"]), (700, 350))
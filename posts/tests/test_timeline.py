@@ -0,0 +1,117 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import timeline
+from posts.models import Follow, Post, TimelineEntry, User
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create(username="Sergey")
+        self.author = User.objects.create(username="Oleg")
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def follow(self):
+        self.reader_client.get(
+            reverse("profile_follow", args=[self.author.username]))
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленту подписчика"""
+        self.follow()
+        self.author_client.post(reverse("new_post"), {"text": "Новый пост"})
+        post = Post.objects.get(text="Новый пост")
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        response = self.reader_client.get(reverse("follow_index"))
+        self.assertEqual(response.context["page"][0], post)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка дозаполняет ленту, отписка очищает ее"""
+        Post.objects.create(text="Старый пост", author=self.author)
+        self.follow()
+        self.assertEqual(self.reader.timeline.count(), 1)
+        self.reader_client.get(
+            reverse("profile_unfollow", args=[self.author.username]))
+        self.assertEqual(self.reader.timeline.count(), 0)
+
+    def test_check_and_rebuild(self):
+        """Проверка находит расхождения, а перестройка их устраняет"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.bulk_create(
+            [Post(text="Мимо сигналов", author=self.author)])
+        self.assertEqual(len(timeline.check()[0]), 1)
+        with self.assertRaises(CommandError):
+            call_command("check_timeline", stdout=StringIO())
+        call_command("rebuild_timeline", stdout=StringIO())
+        self.assertEqual(timeline.check(), (set(), set()))
+        call_command("check_timeline", stdout=StringIO())
+
+
+@override_settings(TIMELINE_FANOUT_THRESHOLD=2)
+class HybridTimelineTest(TestCase):
+    def setUp(self):
+        self.star = User.objects.create(username="Star")
+        self.author = User.objects.create(username="Oleg")
+        self.readers = [
+            User.objects.create(username=f"reader{i}") for i in range(2)
+        ]
+        for reader in self.readers:
+            Follow.objects.create(user=reader, author=self.star)
+        Follow.objects.create(user=self.readers[0], author=self.author)
+        self.client = Client()
+        self.client.force_login(self.readers[0])
+
+    def test_popular_author_is_not_fanned_out(self):
+        """Посты автора выше порога не раскладываются по лентам"""
+        Post.objects.create(text="Пост звезды", author=self.star)
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.star).exists())
+
+    def test_feed_merges_pulled_authors(self):
+        """Лента сливает разложенные посты и посты популярных авторов"""
+        for i in range(4):
+            Post.objects.create(text=f"Звезда {i}", author=self.star)
+            Post.objects.create(text=f"Автор {i}", author=self.author)
+        expected = list(Post.objects.order_by("-pub_date", "-id"))
+        seen = []
+        params = {}
+        while True:
+            response = self.client.get(reverse("follow_index"), params)
+            page = response.context["page"]
+            seen.extend(page.object_list)
+            if not page.has_next():
+                break
+            params = {"after": page.next_cursor}
+        self.assertEqual(seen, expected)
+        back = self.client.get(
+            reverse("follow_index"), {"before": page.previous_cursor})
+        self.assertEqual(list(back.context["page"]), expected[:5])
+
+    def test_dropping_below_threshold_waits_for_rebuild(self):
+        """Автор, опустившийся ниже порога, читается напрямую до
+        перестройки лент и раскладывается только ниже
+        TIMELINE_PUSH_THRESHOLD"""
+        post = Post.objects.create(text="Пост звезды", author=self.star)
+        Follow.objects.get(user=self.readers[1], author=self.star).delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.star).exists())
+        self.assertEqual(timeline.check(), (set(), set()))
+        response = self.client.get(reverse("follow_index"))
+        self.assertIn(post, response.context["page"].object_list)
+
+        with self.settings(TIMELINE_PUSH_THRESHOLD=1):
+            timeline.rebuild()
+        self.assertTrue(timeline.is_pulled(self.star.id))
+
+        with self.settings(TIMELINE_PUSH_THRESHOLD=2):
+            timeline.rebuild()
+        self.assertFalse(timeline.is_pulled(self.star.id))
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.readers[0], post=post).exists())
+        self.assertEqual(timeline.check(), (set(), set()))
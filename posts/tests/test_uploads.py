@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template.defaultfilters import filesizeformat
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image, ImageOps, PngImagePlugin
+
+from posts.caching import clear_local_cache
+from posts.models import Post, User
+from posts.uploads import (JpegMetadataFilter, PngMetadataFilter,
+                           upload_stats)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def jpeg_with_exif(size=(64, 32), orientation=None):
+    exif = Image.Exif()
+    exif[0x010F] = "Camera maker"
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    Image.new("RGB", size, (255, 0, 0)).save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+def png_with_text(size=(64, 32)):
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Comment", "secret location")
+    buffer = BytesIO()
+    Image.new("RGB", size, (0, 255, 0)).save(buffer, "PNG", pnginfo=info)
+    return buffer.getvalue()
+
+
+def feed_by_byte(metadata_filter, data):
+    out = b"".join(
+        metadata_filter.feed(data[i:i + 1]) for i in range(len(data)))
+    return out + metadata_filter.close()
+
+
+class MetadataFilterTest(TestCase):
+    def test_jpeg(self):
+        """Из JPEG вырезается EXIF при любом разбиении на куски"""
+        data = jpeg_with_exif()
+        whole = JpegMetadataFilter().feed(data)
+        self.assertEqual(whole, feed_by_byte(JpegMetadataFilter(), data))
+        self.assertNotIn(b"Exif", whole)
+        with Image.open(BytesIO(whole)) as image:
+            image.load()
+            self.assertEqual(image.size, (64, 32))
+
+    def test_jpeg_orientation_is_kept(self):
+        """Из EXIF остается только поворот снимка"""
+        data = jpeg_with_exif(orientation=6)
+        whole = JpegMetadataFilter().feed(data)
+        self.assertEqual(whole, feed_by_byte(JpegMetadataFilter(), data))
+        self.assertNotIn(b"Camera maker", whole)
+        with Image.open(BytesIO(whole)) as image:
+            self.assertEqual(dict(image.getexif()), {0x0112: 6})
+            self.assertEqual(ImageOps.exif_transpose(image).size, (32, 64))
+
+    def test_png(self):
+        """Из PNG вырезаются текстовые чанки"""
+        data = png_with_text()
+        whole = PngMetadataFilter().feed(data)
+        self.assertEqual(whole, feed_by_byte(PngMetadataFilter(), data))
+        self.assertNotIn(b"secret location", whole)
+        with Image.open(BytesIO(whole)) as image:
+            image.load()
+            self.assertEqual(image.size, (64, 32))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0,
+                   IMAGE_PROCESSES=0)
+class BoundedUploadTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.user = User.objects.create(username="Sergey")
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def upload(self, data, name="image.jpg", client=None):
+        return (client or self.client).post(reverse("new_post"), {
+            "text": "Пост с картинкой",
+            "image": SimpleUploadedFile(name, data),
+        })
+
+    def test_metadata_is_stripped(self):
+        """Сохраненный оригинал не содержит EXIF"""
+        self.upload(jpeg_with_exif())
+        post = Post.objects.get(text="Пост с картинкой")
+        with open(os.path.join(MEDIA_ROOT, post.image.name), "rb") as file:
+            self.assertNotIn(b"Exif", file.read())
+        self.assertEqual(upload_stats()["uploads"], 1)
+
+    @override_settings(POST_IMAGE_MAX_BYTES=1024)
+    def test_file_over_byte_cap_is_rejected(self):
+        """Файл больше предела отвергается с ошибкой формы"""
+        response = self.upload(jpeg_with_exif((600, 600)))
+        self.assertFormError(
+            response, "form", "image",
+            f"Файл больше {filesizeformat(1024)}",
+        )
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(upload_stats()["rejected"], 1)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_is_rejected(self):
+        """Картинка с большими размерами отвергается по заголовку"""
+        response = self.upload(png_with_text(), "image.png")
+        self.assertFormError(
+            response, "form", "image",
+            "Слишком большое изображение: 64x32 пикселей",
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100 * 100)
+    def test_padded_header_is_rejected(self):
+        """Сегменты APP перед размерами не позволяют обойти проверку"""
+        data = jpeg_with_exif((400, 400))
+        padding = b"\xff\xe2\xff\xff" + b"\x00" * 0xFFFD
+        response = self.upload(data[:2] + padding * 5 + data[2:])
+        self.assertFormError(
+            response, "form", "image",
+            "Не удалось прочитать размеры изображения",
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_not_an_image(self):
+        """Не картинку отвергает форма"""
+        response = self.upload(b"not an image" * 10, "image.txt")
+        self.assertTrue(response.context["form"].errors["image"])
+
+    def test_csrf_is_still_checked(self):
+        """Подключение обработчика не отключает проверку CSRF"""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = self.upload(jpeg_with_exif(), client=client)
+        self.assertEqual(response.status_code, 403)
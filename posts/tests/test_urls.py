@@ -1,4 +1,5 @@
 from django.test import TestCase, Client
+from django.urls import reverse
 
 from posts.models import Group, Post, User, Comment
 
@@ -123,3 +124,35 @@ class StaticURLTests(TestCase):
             with self.subTest(url=url):
                 response = self.authorized_client.get(url)
                 self.assertTemplateUsed(response, template)
+
+
+class ReservedUsernameTest(TestCase):
+    def signup(self, username):
+        return Client().post(reverse("signup"), {
+            "username": username,
+            "password1": "Sup3r-secret",
+            "password2": "Sup3r-secret",
+        })
+
+    def test_feed_fragment_username_is_reserved(self):
+        """Профиль пользователя posts перекрывала бы лента /posts/"""
+        response = self.signup("posts")
+        self.assertFormError(
+            response, "form", "username", "Это имя пользователя занято")
+        self.assertFalse(User.objects.filter(username="posts").exists())
+
+    def test_search_username_is_reserved(self):
+        """Профиль пользователя search перекрывал бы поиск /search/"""
+        response = self.signup("search")
+        self.assertFormError(
+            response, "form", "username", "Это имя пользователя занято")
+
+    def test_user_subpage_username_is_reserved(self):
+        """Ленту пользователя group перекрывала бы группа /group/posts/"""
+        response = self.signup("group")
+        self.assertFormError(
+            response, "form", "username", "Это имя пользователя занято")
+
+    def test_regular_username(self):
+        self.signup("poster")
+        self.assertTrue(User.objects.filter(username="poster").exists())
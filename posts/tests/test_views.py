@@ -1,4 +1,5 @@
 from django import forms
+from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
 
@@ -111,13 +112,16 @@ class PostPagesTest(TestCase):
         self.assertEqual(len(response_index.context["page"]), 2)
 
     def test_cache(self):
-        """Главная страница корректно кэширует список записей."""
+        """Главная страница кэшируется для гостя до новой записи."""
+        cache.clear()
         first_response = self.guest_client.get(reverse("index"))
-        first_post = first_response.context["page"][0]
-        self.post.text = "Новый пост"
+        # update() не вызывает сигналов, поэтому кэш не сбрасывается
+        Post.objects.filter(pk=self.post.pk).update(text="Без сброса")
         second_response = self.guest_client.get(reverse("index"))
-        second_post = second_response.context["page"][0]
-        self.assertEqual(first_post, second_post)
+        self.assertEqual(first_response.content, second_response.content)
+        Post.objects.create(text="Новый пост", author=self.user)
+        third_response = self.guest_client.get(reverse("index"))
+        self.assertContains(third_response, "Новый пост")
 
     def test_auth_user_can_comment(self):
         """Только авторизированный пользователь может комментировать посты."""
@@ -0,0 +1,78 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Comment
+
+# Знак больше любого знака пути: [path, path + END) - все поддерево path
+END = "~"
+# Отступ в шаблоне не растет глубже этого уровня
+MAX_INDENT = 6
+
+
+class MoreReplies:
+    """Ссылка на непоказанную часть ветки comment: ее ответы с путями
+    после after"""
+
+    is_more = True
+
+    def __init__(self, comment, after=None, count=None):
+        self.comment = comment
+        self.after = after
+        self.count = count
+        self.indent = min(comment.depth + 1, MAX_INDENT)
+
+
+def _subtree(root, after=None):
+    return Q(path__gt=after or root.path, path__lt=root.path + END,
+             depth__lte=root.depth + settings.COMMENT_THREAD_DEPTH)
+
+
+def _fetch_replies(post, roots, after):
+    """Ответы веток roots одним запросом: по диапазону путей на каждую
+    ветку. Возвращает ответы и путь последнего, если дальше есть еще"""
+    limit = settings.COMMENT_THREAD_REPLIES
+    with_replies = [root for root in roots if root.reply_count]
+    if not with_replies:
+        return [], None
+    replies = list(
+        Comment.objects.filter(post=post).filter(reduce(
+            or_, (_subtree(root, after) for root in with_replies)
+        )).select_related("author").order_by("path")[:limit + 1]
+    )
+    if len(replies) <= limit:
+        return replies, None
+    return replies[:limit], replies[limit - 1].path
+
+
+def expand(post, roots, after=None, include_roots=True):
+    """Разворачивает ветки roots в плоский список для шаблона: корень,
+    затем его ответы в порядке путей, не глубже COMMENT_THREAD_DEPTH
+    уровней от корня и не больше COMMENT_THREAD_REPLIES ответов на все
+    ветки. На месте непоказанных ответов - MoreReplies. after - путь,
+    после которого продолжить единственную ветку"""
+    roots = list(roots)
+    replies, last = _fetch_replies(post, roots, after)
+    items = []
+    for root in roots:
+        if include_roots:
+            root.indent = min(root.depth, MAX_INDENT)
+            items.append(root)
+        bottom = root.depth + settings.COMMENT_THREAD_DEPTH
+        for reply in replies:
+            if not reply.path.startswith(root.path):
+                continue
+            reply.indent = min(reply.depth, MAX_INDENT)
+            items.append(reply)
+            if reply.depth == bottom and reply.reply_count:
+                items.append(MoreReplies(reply, count=reply.reply_count))
+        if last is None or not root.reply_count:
+            continue
+        if last.startswith(root.path):
+            # Ответы оборвались на этой ветке
+            items.append(MoreReplies(root, after=last))
+        elif root.path > last:
+            items.append(MoreReplies(root, count=root.reply_count))
+    return items
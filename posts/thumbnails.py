@@ -0,0 +1,157 @@
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F
+
+from . import imaging, storage
+from .caching import bump_generations, post_generations
+from .models import Post
+from .surrogate import post_keys, purge
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_process_pool = None
+_pending = set()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            settings.THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+    return _executor
+
+
+def _get_process_pool():
+    # spawn, а не fork: форк процесса с потоками и открытыми соединениями
+    # небезопасен, а imaging от Django не зависит
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            settings.IMAGE_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+def _encode(data):
+    options = settings.POST_IMAGE_VARIANTS
+    args = (data, options["widths"], options["aspect"],
+            options["formats"], options["quality"])
+    if not settings.IMAGE_PROCESSES:
+        return imaging.render_variants(*args)
+    return _get_process_pool().submit(
+        imaging.render_variants, *args).result()
+
+
+def render(image):
+    """Кодирует варианты картинки и сохраняет их рядом с ней. Возвращает
+    метаданные для Post.thumbnail_data: размеры самого широкого варианта
+    и пути вариантов по форматам"""
+    with image.open("rb") as source:
+        data = source.read()
+    stem = os.path.splitext(os.path.basename(image.name))[0]
+    storage = image.storage
+    result = {"width": 0, "height": 0, "variants": {}}
+    for width, height, image_format, content in _encode(data):
+        extension = imaging.EXTENSIONS[image_format]
+        name = storage.save(
+            f"posts/variants/{stem}-{width}.{extension}",
+            ContentFile(content),
+        )
+        result["variants"].setdefault(extension, []).append([name, width])
+        if width > result["width"]:
+            result["width"], result["height"] = width, height
+    return result
+
+
+def variant_names(thumbnail_data):
+    """Пути всех вариантов из Post.thumbnail_data"""
+    if not thumbnail_data:
+        return []
+    return [
+        name
+        for variants in json.loads(thumbnail_data)["variants"].values()
+        for name, _ in variants
+    ]
+
+
+def _reuse(post):
+    """Варианты той же картинки у другого поста: в хранилище с адресацией
+    по содержимому одинаковые картинки имеют одно имя"""
+    return Post.objects.filter(image=post.image.name).exclude(
+        pk=post.pk).exclude(thumbnail_data="").values_list(
+        "thumbnail_data", flat=True).first()
+
+
+def generate(post_id):
+    """Готовит варианты картинки поста и сохраняет их в посте. Если
+    картинку успели заменить, результат не сохраняется"""
+    post = Post.objects.for_feed().filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    thumbnail_data = _reuse(post)
+    if thumbnail_data:
+        storage.acquire(variant_names(thumbnail_data), post.image.storage)
+    else:
+        try:
+            thumbnail_data = json.dumps(render(post.image))
+        except Exception:
+            logger.exception(
+                "Не удалось подготовить картинки поста %s", post_id)
+            return
+    updated = Post.objects.filter(pk=post_id, image=post.image.name).update(
+        thumbnail_data=thumbnail_data,
+        version=F("version") + 1,
+    )
+    if not updated:
+        storage.release(variant_names(thumbnail_data), post.image.storage)
+        return
+    bump_generations(*post_generations(
+        post.author.username, post.group and post.group.slug))
+    purge(*post_keys(post))
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    finally:
+        # Поток пула живет дольше запроса, соединение за собой закрываем
+        connection.close()
+
+
+def schedule(post):
+    """Сбрасывает варианты старой картинки поста и ставит подготовку
+    вариантов новой в очередь после коммита. Пока их нет, карточка
+    показывает исходную картинку. При THUMBNAIL_WORKERS = 0 варианты
+    готовятся сразу"""
+    old = Post.objects.filter(pk=post.pk).values_list(
+        "thumbnail_data", flat=True).first()
+    Post.objects.filter(pk=post.pk).update(
+        thumbnail_data="", version=F("version") + 1)
+    storage.release(variant_names(old), post.image.storage)
+    if not post.image:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        generate(post.pk)
+        return
+    transaction.on_commit(lambda: _submit(post.pk))
+
+
+def _submit(post_id):
+    future = _get_executor().submit(_run, post_id)
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+
+
+def wait_pending(timeout=None):
+    """Ждет завершения поставленных в очередь задач. Нужно тестам,
+    которые очищают базу после запроса"""
+    wait(list(_pending), timeout)
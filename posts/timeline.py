@@ -0,0 +1,178 @@
+from django.conf import settings
+from django.db import transaction
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginator import CursorPaginator, MergedCursorPaginator
+
+BATCH_SIZE = 500
+
+
+def followers_count(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id
+    ).values_list("followers_count", flat=True).first() or 0
+
+
+def is_pulled(author_id):
+    """Посты авторов, набравших TIMELINE_FANOUT_THRESHOLD подписчиков,
+    не раскладываются по лентам, а подмешиваются при чтении"""
+    return UserStats.objects.filter(
+        user_id=author_id, timeline_pulled=True).exists()
+
+
+def pulled_authors(user_id=None):
+    """id авторов из подписок пользователя (без user_id - всех авторов),
+    чьи посты подмешиваются при чтении"""
+    if user_id is None:
+        return set(UserStats.objects.filter(
+            timeline_pulled=True
+        ).values_list("user_id", flat=True))
+    return set(Follow.objects.filter(
+        user_id=user_id,
+        author__stats__timeline_pulled=True,
+    ).values_list("author_id", flat=True))
+
+
+def update_pulled():
+    """Переводит авторов между раскладкой и чтением напрямую по числу
+    подписчиков. Обратно к раскладке автор возвращается только ниже
+    TIMELINE_PUSH_THRESHOLD: автор у порога не переключается туда
+    и обратно"""
+    UserStats.objects.filter(
+        timeline_pulled=False,
+        followers_count__gte=settings.TIMELINE_FANOUT_THRESHOLD,
+    ).update(timeline_pulled=True)
+    UserStats.objects.filter(
+        timeline_pulled=True,
+        followers_count__lt=settings.TIMELINE_PUSH_THRESHOLD,
+    ).update(timeline_pulled=False)
+
+
+def _bulk_insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def push_post(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора"""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list("user_id", flat=True)
+    _bulk_insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика все посты автора"""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list("id", "pub_date")
+    _bulk_insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты подписчика посты автора"""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def follow(user_id, author_id):
+    """Обновляет ленты после новой подписки"""
+    if is_pulled(author_id):
+        return
+    if followers_count(author_id) < settings.TIMELINE_FANOUT_THRESHOLD:
+        backfill(user_id, author_id)
+        return
+    # Автор только что перешел порог: дальше его посты читаются
+    # напрямую, а разложенные копии больше не нужны
+    UserStats.objects.filter(user_id=author_id).update(timeline_pulled=True)
+    TimelineEntry.objects.filter(author_id=author_id).delete()
+
+
+def unfollow(user_id, author_id):
+    """Обновляет ленты после отписки. Автор, опустившийся ниже порога,
+    остается в чтении напрямую: раскладка его постов оставшимся
+    подписчикам - это запись по всем их лентам, ее делает rebuild"""
+    prune(user_id, author_id)
+
+
+def rebuild(user_ids=None):
+    """Перестраивает ленты с нуля по таблице подписок.
+    Без user_ids перестраивает ленты всех пользователей и сначала
+    переключает авторов между раскладкой и чтением напрямую"""
+    follows = Follow.objects.all()
+    entries = TimelineEntry.objects.all()
+    if user_ids is not None:
+        follows = follows.filter(user_id__in=user_ids)
+        entries = entries.filter(user_id__in=user_ids)
+    with transaction.atomic():
+        if user_ids is None:
+            update_pulled()
+        pulled = pulled_authors()
+        entries.delete()
+        for user_id, author_id in follows.exclude(
+                author_id__in=pulled).values_list(
+                "user_id", "author_id").iterator():
+            backfill(user_id, author_id)
+
+
+def expected_entries(user_ids=None):
+    """Множество (user_id, post_id), которое должно быть в лентах"""
+    posts = Post.objects.filter(
+        author__following__isnull=False
+    ).exclude(author_id__in=pulled_authors())
+    if user_ids is not None:
+        posts = posts.filter(author__following__user_id__in=user_ids)
+    return set(posts.values_list("author__following__user_id", "id"))
+
+
+def check(user_ids=None):
+    """Сверяет материализованные ленты с подписками. Возвращает пару
+    множеств (недостающие, лишние) записей (user_id, post_id)"""
+    entries = TimelineEntry.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+    actual = set(entries.values_list("user_id", "post_id"))
+    expected = expected_entries(user_ids)
+    return expected - actual, actual - expected
+
+
+def feed_paginator(user, per_page):
+    """Паджинатор ленты подписок: материализованная лента пользователя,
+    слитая с лентами авторов, чьи посты подмешиваются при чтении"""
+    pulled = pulled_authors(user.id)
+    entries = TimelineEntry.objects.filter(user=user).exclude(
+        author_id__in=pulled
+    ).select_related("post__author", "post__group")
+    paginator = CursorPaginator(
+        entries, per_page, tiebreaker="post_id",
+        prepare=lambda rows: [entry.post for entry in rows],
+    )
+    if not pulled:
+        return paginator
+    return MergedCursorPaginator(
+        [paginator] + [
+            CursorPaginator(
+                Post.objects.for_feed().filter(author_id=author_id),
+                per_page)
+            for author_id in pulled
+        ],
+        per_page,
+    )
@@ -0,0 +1,321 @@
+import logging
+import time
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Сколько начальных байт файла ждать, пока Pillow не разберет заголовок.
+# EXIF в JPEG идет до размеров картинки и занимает до 64 КБ. Файл, чей
+# заголовок не разобран и здесь, отвергается
+HEADER_LIMIT = 256 * 1024
+
+
+EXIF_HEADER = b"Exif\x00\x00"
+ORIENTATION_TAG = 0x0112
+
+
+def exif_orientation(payload):
+    """Значение тега Orientation из IFD0 данных EXIF или None"""
+    tiff = payload[len(EXIF_HEADER):]
+    if tiff[:2] == b"II":
+        order = "little"
+    elif tiff[:2] == b"MM":
+        order = "big"
+    else:
+        return None
+    offset = int.from_bytes(tiff[4:8], order)
+    count = int.from_bytes(tiff[offset:offset + 2], order)
+    for index in range(count):
+        entry = tiff[offset + 2 + index * 12:offset + 14 + index * 12]
+        if len(entry) < 12:
+            return None
+        if int.from_bytes(entry[:2], order) == ORIENTATION_TAG:
+            # Тип SHORT, значение лежит в первых двух байтах поля
+            return int.from_bytes(entry[8:10], order)
+    return None
+
+
+def orientation_segment(orientation):
+    """Сегмент APP1 с EXIF из одного тега Orientation"""
+    tiff = (
+        b"MM\x00\x2a\x00\x00\x00\x08"  # заголовок TIFF, IFD0 сразу за ним
+        + (1).to_bytes(2, "big")
+        + ORIENTATION_TAG.to_bytes(2, "big") + (3).to_bytes(2, "big")
+        + (1).to_bytes(4, "big") + orientation.to_bytes(2, "big") + b"\x00\x00"
+        + (0).to_bytes(4, "big")  # следующего IFD нет
+    )
+    payload = EXIF_HEADER + tiff
+    return b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload
+
+
+class JpegMetadataFilter:
+    """Потоково вырезает из JPEG сегменты метаданных: APP1 (EXIF, XMP)
+    и APP13 (IPTC). Из EXIF остается только тег Orientation: без него
+    снимки с телефона показывались бы повернутыми. Сегменты до начала
+    скана не длиннее 64 КБ, поэтому буфер ограничен. После маркера SOS
+    данные идут без изменений"""
+
+    DROP = {0xE1, 0xED}
+    APP1 = 0xE1
+    SOS = 0xDA
+
+    def __init__(self):
+        self._buffer = b""
+        self._started = False
+        self._scan = False
+
+    def feed(self, data):
+        if self._scan:
+            return data
+        self._buffer += data
+        out = []
+        if not self._started:
+            if len(self._buffer) < 2:
+                return b""
+            out.append(self._buffer[:2])
+            self._buffer = self._buffer[2:]
+            self._started = True
+        while len(self._buffer) >= 4:
+            if self._buffer[0] != 0xFF or self._buffer[1] == self.SOS:
+                self._scan = True
+                break
+            if 0xD0 <= self._buffer[1] <= 0xD8 or self._buffer[1] == 0x01:
+                # Маркеры без длины
+                out.append(self._buffer[:2])
+                self._buffer = self._buffer[2:]
+                continue
+            length = 2 + int.from_bytes(self._buffer[2:4], "big")
+            if len(self._buffer) < length:
+                break
+            out.append(self._filter_segment(self._buffer[:length]))
+            self._buffer = self._buffer[length:]
+        if self._scan:
+            out.append(self._buffer)
+            self._buffer = b""
+        return b"".join(out)
+
+    def close(self):
+        rest, self._buffer = self._buffer, b""
+        return rest
+
+    def _filter_segment(self, segment):
+        if segment[1] not in self.DROP:
+            return segment
+        payload = segment[4:]
+        if segment[1] != self.APP1 or not payload.startswith(EXIF_HEADER):
+            return b""
+        orientation = exif_orientation(payload)
+        if orientation is None or not 2 <= orientation <= 8:
+            return b""
+        return orientation_segment(orientation)
+
+
+class PngMetadataFilter:
+    """Потоково вырезает из PNG чанки метаданных. Остальные чанки, в том
+    числе большие IDAT, передаются дальше без буферизации"""
+
+    DROP = {b"eXIf", b"tEXt", b"zTXt", b"iTXt"}
+    SIGNATURE_SIZE = 8
+
+    def __init__(self):
+        self._buffer = b""
+        self._started = False
+        # Сколько байт текущего чанка осталось передать или пропустить
+        self._pass = 0
+        self._skip = 0
+
+    def feed(self, data):
+        self._buffer += data
+        out = []
+        if not self._started:
+            if len(self._buffer) < self.SIGNATURE_SIZE:
+                return b""
+            out.append(self._buffer[:self.SIGNATURE_SIZE])
+            self._buffer = self._buffer[self.SIGNATURE_SIZE:]
+            self._started = True
+        while self._buffer:
+            if self._pass:
+                chunk = self._buffer[:self._pass]
+                out.append(chunk)
+                self._pass -= len(chunk)
+                self._buffer = self._buffer[len(chunk):]
+                continue
+            if self._skip:
+                skipped = min(self._skip, len(self._buffer))
+                self._skip -= skipped
+                self._buffer = self._buffer[skipped:]
+                continue
+            if len(self._buffer) < 8:
+                break
+            # Данные чанка и его CRC
+            length = int.from_bytes(self._buffer[:4], "big") + 4
+            if self._buffer[4:8] in self.DROP:
+                self._skip = length
+            else:
+                out.append(self._buffer[:8])
+                self._pass = length
+            self._buffer = self._buffer[8:]
+        return b"".join(out)
+
+    def close(self):
+        rest, self._buffer = self._buffer, b""
+        return rest
+
+
+class PassthroughFilter:
+    def feed(self, data):
+        return data
+
+    def close(self):
+        return b""
+
+
+METADATA_FILTERS = {"JPEG": JpegMetadataFilter, "PNG": PngMetadataFilter}
+
+
+def upload_errors(request):
+    """Ошибки загрузки файлов запроса по именам полей формы"""
+    if not hasattr(request, "_upload_errors"):
+        request._upload_errors = {}
+    return request._upload_errors
+
+
+class BoundedImageUploadHandler(FileUploadHandler):
+    """Пишет загружаемую картинку во временный файл по мере получения.
+
+    Файл больше POST_IMAGE_MAX_BYTES и картинка больше
+    POST_IMAGE_MAX_PIXELS пикселей отбрасываются: размеры читаются из
+    заголовка до полного декодирования. Метаданные JPEG и PNG вырезаются
+    на лету. Ошибки попадают в upload_errors(request)"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset,
+            self.content_type_extra,
+        )
+        self.started = time.monotonic()
+        self.received = 0
+        self.written = 0
+        self.head = b""
+        self.filter = None
+
+    def _reject(self, message):
+        upload_errors(self.request)[self.field_name] = message
+        self.file.close()
+        record_upload(rejected=1)
+        raise SkipFile(message)
+
+    def _write(self, data):
+        self.file.write(data)
+        self.written += len(data)
+
+    def _check_header(self):
+        try:
+            with Image.open(BytesIO(self.head)) as image:
+                width, height = image.size
+                image_format = image.format
+        except Image.DecompressionBombError:
+            self._reject("Слишком большое изображение")
+        except Exception:
+            # Заголовок еще не дочитан. Без размеров файл дальше не
+            # принимаем: иначе картинку без проверки размеров пропустили
+            # бы сегменты метаданных перед заголовком
+            if len(self.head) >= HEADER_LIMIT:
+                self._reject("Не удалось прочитать размеры изображения")
+            return
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            self._reject(
+                f"Слишком большое изображение: {width}x{height} пикселей")
+        self.filter = METADATA_FILTERS.get(
+            image_format, PassthroughFilter)()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            limit = filesizeformat(settings.POST_IMAGE_MAX_BYTES)
+            self._reject(f"Файл больше {limit}")
+        if self.filter is None:
+            self.head += raw_data
+            self._check_header()
+            if self.filter is None:
+                return None
+            raw_data, self.head = self.head, b""
+        self._write(self.filter.feed(raw_data))
+        return None
+
+    def file_complete(self, file_size):
+        if self.filter is None:
+            # Заголовок так и не разобран: не картинку отвергнет форма
+            self.filter = PassthroughFilter()
+            self._write(self.filter.feed(self.head))
+        self._write(self.filter.close())
+        self.file.seek(0)
+        self.file.size = self.written
+        record_upload(self.received, time.monotonic() - self.started)
+        return self.file
+
+
+def bounded_image_upload(view):
+    """Подключает BoundedImageUploadHandler к view. Обработчик должен
+    стоять до чтения request.POST, а его читает проверка CSRF, поэтому
+    CSRF проверяется уже после подключения"""
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers.insert(
+            0, BoundedImageUploadHandler(request))
+        return protected(request, *args, **kwargs)
+    return wrapper
+
+
+UPLOAD_STATS = ("uploads", "rejected", "bytes", "microseconds")
+
+
+def _stats_key(name):
+    return f"upload_stats:{name}"
+
+
+def record_upload(size=0, seconds=0, rejected=0):
+    """Учитывает загрузку в счетчиках, см. upload_stats"""
+    values = {
+        "uploads": 0 if rejected else 1,
+        "rejected": rejected,
+        "bytes": size,
+        "microseconds": int(seconds * 10 ** 6),
+    }
+    for name, value in values.items():
+        if not value:
+            continue
+        key = _stats_key(name)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            if not cache.add(key, value, None):
+                cache.incr(key, value)
+    if not rejected:
+        logger.info(
+            "Загружено %s байт за %.3f с (%.1f КБ/с)", size, seconds,
+            size / 1024 / seconds if seconds else 0,
+        )
+
+
+def upload_stats():
+    """Число принятых и отвергнутых загрузок, их объем и средняя
+    скорость приема в байтах в секунду"""
+    values = cache.get_many([_stats_key(name) for name in UPLOAD_STATS])
+    stats = {name: values.get(_stats_key(name), 0) for name in UPLOAD_STATS}
+    seconds = stats["microseconds"] / 10 ** 6
+    stats["throughput"] = stats["bytes"] / seconds if seconds else 0
+    return stats
@@ -5,15 +5,34 @@ from . import views
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path("posts/", views.index_fragment, name="index_fragment"),
     path("new/", views.new_post, name="new_post"),
     path("group/<slug:slug>/", views.group_posts, name="group_posts"),
+    path("group/<slug:slug>/posts/", views.group_posts_fragment,
+         name="group_posts_fragment"),
+    path("group/<slug:slug>/events/", views.group_events,
+         name="group_events"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("follow/posts/", views.follow_index_fragment,
+         name="follow_index_fragment"),
+    path("follow/events/", views.follow_events, name="follow_events"),
+    path("search/", views.search, name="search"),
     path("<str:username>/", views.profile, name="profile"),
+    path("<str:username>/posts/", views.profile_fragment,
+         name="profile_fragment"),
     path("<str:username>/<int:post_id>/", views.post_view, name="post"),
     path("<str:username>/<int:post_id>/edit/",
          views.post_edit,
          name="post_edit"
          ),
+    path("<str:username>/<int:post_id>/comments/",
+         views.post_comments,
+         name="post_comments"
+         ),
+    path("<str:username>/<int:post_id>/comments/<int:comment_id>/",
+         views.comment_thread,
+         name="comment_thread"
+         ),
     path("<str:username>/<int:post_id>/comment",
          views.add_comment,
          name="add_comment"
@@ -1,9 +1,25 @@
+from urllib.parse import urlencode
+
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.urls import reverse
+
+from . import events, threads, thumbnails, timeline
+from .caching import cache_anonymous_page
+from .conditional import (conditional_page, group_state, index_state,
+                          post_state, profile_state)
+from .models import Comment, Follow, Post, Group, User
+from .forms import PostForm, CommentForm, SearchForm
+from .paginator import get_cursor_page
+from .search import SearchPaginator
+from .stats import get_stats
+from .surrogate import page_keys, post_keys, set_cache_headers
+from .uploads import bounded_image_upload, upload_errors
 
-from .models import Follow, Post, Group, User
-from .forms import PostForm, CommentForm
+COMMENTS_PER_PAGE = 20
+# Карточки ленты со ссылкой на следующую порцию, без разметки страницы
+FEED_FRAGMENT = "posts/feed_items.html"
 
 
 def page_not_found(request, exception):
@@ -20,103 +36,240 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
+def _render_feed(request, template, page, context, keys=None):
+    """Рендерит страницу ленты или ее фрагмент. Фрагмент
+    (posts/feed_items.html) - только карточки страницы и ссылка на
+    следующую порцию, полная страница включает тот же шаблон. Курсор
+    следующей порции дублируется в заголовке X-Next-Cursor"""
+    context = dict(context, page=page)
+    response = render(request, template, context)
+    if page.has_next():
+        response["X-Next-Cursor"] = page.next_cursor
+    if keys is None:
+        return response
+    return set_cache_headers(request, response, page_keys(page, *keys))
+
+
+def _index_feed(request):
+    page = get_cursor_page(request, Post.objects.for_feed(), 10)
+    return page, {"fragment_url": reverse("index_fragment")}, ["index"]
+
+
+@conditional_page(index_state)
+@cache_anonymous_page("index")
 def index(request):
     """Вовращает на главную страницу"""
-    latest = Post.objects.all()[:11]
-    paginator = Paginator(latest, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    context = {"page": page}
-    return render(request, "index.html", context)
+    return _render_feed(request, "index.html", *_index_feed(request))
 
 
-def group_posts(request, slug: str):
-    """Возвращает на страницу группы постов"""
+@conditional_page(index_state)
+@cache_anonymous_page("index")
+def index_fragment(request):
+    """Возвращает следующую порцию постов главной страницы"""
+    return _render_feed(request, FEED_FRAGMENT, *_index_feed(request))
+
+
+def _group_feed(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()[:12]
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    page = get_cursor_page(request, group.posts.for_feed(), 10)
     context = {
         "group": group,
-        "page": page,
+        "fragment_url": reverse("group_posts_fragment", args=[slug]),
     }
-    return render(request, "group.html", context)
+    return page, context, [f"group-{group.pk}"]
+
+
+@conditional_page(group_state)
+@cache_anonymous_page("group:{slug}")
+def group_posts(request, slug: str):
+    """Возвращает на страницу группы постов"""
+    return _render_feed(request, "group.html", *_group_feed(request, slug))
+
+
+@conditional_page(group_state)
+@cache_anonymous_page("group:{slug}")
+def group_posts_fragment(request, slug: str):
+    """Возвращает следующую порцию постов группы"""
+    return _render_feed(request, FEED_FRAGMENT, *_group_feed(request, slug))
+
+
+def search(request):
+    """Полнотекстовый поиск постов по релевантности с фильтрами по группе
+    и автору"""
+    form = SearchForm(request.GET or None)
+    page = None
+    query_prefix = ""
+    if form.is_valid() and form.cleaned_data["q"]:
+        group, author = form.cleaned_data["group"], form.cleaned_data["author"]
+        paginator = SearchPaginator(
+            form.cleaned_data["q"], 10,
+            group_id=group and group.pk,
+            author_id=author and author.pk,
+        )
+        page = paginator.get_page(
+            after=request.GET.get("after"),
+            before=request.GET.get("before"),
+        )
+        # Ссылки паджинатора сохраняют запрос и фильтры
+        query_prefix = urlencode({
+            name: request.GET[name] for name in ("q", "group", "author")
+            if request.GET.get(name)
+        }) + "&"
+    context = {"form": form, "page": page, "query_prefix": query_prefix}
+    return render(request, "posts/search.html", context)
 
 
 @login_required
+@bounded_image_upload
 def new_post(request):
     """Создает новый пост и возвращает на главную страницу, если форма
     заполнения валидна. Если не валидна, то возвращает на страницу
     создания поста"""
-    form = PostForm(request.POST or None, request.FILES or None,)
+    form = PostForm(
+        request.POST or None, request.FILES or None,
+        upload_errors=upload_errors(request),
+    )
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            thumbnails.schedule(post)
+        events.publish(post)
         return redirect("index")
     return render(request, "posts/new.html", {"form": form})
 
 
+def _profile_feed(request, username):
+    author = get_object_or_404(
+        User.objects.select_related("stats"), username=username)
+    page = get_cursor_page(request, author.posts.for_feed(), 5)
+    context = {
+        "author": author,
+        "fragment_url": reverse("profile_fragment", args=[username]),
+    }
+    return page, context, [f"author-{author.pk}"]
+
+
+@conditional_page(profile_state)
+@cache_anonymous_page("author:{username}")
 def profile(request, username: str):
     """Возвращает страницу профиля"""
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    post_count = post_list.count()
-    paginator = Paginator(post_list, 5)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    follow_count = author.follower.all().count()
-    followers_count = author.following.all().count()
-
+    page, context, keys = _profile_feed(request, username)
+    author = context["author"]
     following = (
         request.user.is_authenticated and Follow.objects.filter(
             user=request.user, author=author).exists()
     )
-    context = {
-        "page": page,
-        "author": author,
-        "post_count": post_count,
-        "follow_count": follow_count,
-        "followers_count": followers_count,
-        "following": following,
-    }
-    return render(request, "posts/profile.html", context, )
+    context.update(stats=get_stats(author), following=following)
+    return _render_feed(request, "posts/profile.html", page, context, keys)
+
+
+@conditional_page(profile_state)
+@cache_anonymous_page("author:{username}")
+def profile_fragment(request, username: str):
+    """Возвращает следующую порцию постов автора"""
+    return _render_feed(
+        request, FEED_FRAGMENT, *_profile_feed(request, username))
+
 
+def _comment_page(request, post):
+    """Страница комментариев верхнего уровня с развернутыми ветками
+    ответов"""
+    comments = post.comments.filter(parent=None).select_related("author")
+    page = get_cursor_page(
+        request, comments, COMMENTS_PER_PAGE, field="created")
+    page.items = threads.expand(post, page)
+    return page
 
+
+@conditional_page(post_state)
 def post_view(request, username: str, post_id: int):
-    """Возвращает страницу просмотра конкретного поста"""
-    post = get_object_or_404(Post, author__username=username, id=post_id)
+    """Возвращает страницу просмотра конкретного поста с первой страницей
+    комментариев (или страницей после курсора ?after=)"""
+    post = get_object_or_404(
+        Post.objects.for_feed().select_related("author__stats"),
+        author__username=username,
+        id=post_id,
+    )
     form = CommentForm(request.POST or None)
+    comment_page = _comment_page(request, post)
     context = {
         "post": post,
         "author": post.author,
+        "stats": get_stats(post.author),
         "form": form,
-        "comments": post.comments.all(),
+        # Комментарии верхнего уровня только этой страницы: запрос
+        # ограничен их id и не выполняется, пока шаблон их не читает
+        "comments": post.comments.filter(
+            id__in=[comment.id for comment in comment_page]
+        ).order_by("-created", "-id"),
+        "comment_page": comment_page,
+        "reply_to": request.GET.get("reply_to", ""),
     }
-    return render(request, "posts/post.html", context)
+    response = render(request, "posts/post.html", context)
+    return set_cache_headers(request, response, post_keys(post))
+
+
+@conditional_page(post_state)
+def post_comments(request, username: str, post_id: int):
+    """Возвращает только следующую страницу комментариев поста для
+    подгрузки на странице поста"""
+    post = get_object_or_404(
+        Post.objects.select_related("author", "group"),
+        author__username=username,
+        id=post_id,
+    )
+    comment_page = _comment_page(request, post)
+    context = {"post": post, "comment_page": comment_page}
+    response = render(request, "posts/comment_list.html", context)
+    return set_cache_headers(request, response, post_keys(post))
 
 
 @login_required
+@bounded_image_upload
 def post_edit(request, username: str, post_id: int):
     """Редактирует пост, если залогиненный пользователь является автором поста.
     После редактирования отправляет на конкретный пост автора."""
     post = get_object_or_404(Post, id=post_id)
     if post.author != request.user:
         return redirect("post", username=username, post_id=post_id)
-    elif request.method == "POST":
-        form = PostForm(
-            request.POST or None,
-            files=request.FILES or None,
-            instance=post
-        )
-        if form.is_valid():
-            form.save()
-            return redirect("post", username=username, post_id=post_id)
-    form = PostForm(instance=post)
+    # Невалидная форма показывается с ошибками, в том числе загрузки
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+        instance=post,
+        upload_errors=upload_errors(request),
+    )
+    if form.is_valid():
+        form.save()
+        if "image" in form.changed_data:
+            thumbnails.schedule(post)
+        return redirect("post", username=username, post_id=post_id)
     return render(request, "posts/new.html", {"form": form, "post": post})
 
 
+@conditional_page(post_state)
+def comment_thread(request, username: str, post_id: int, comment_id: int):
+    """Возвращает ответы на комментарий, не показанные на странице поста:
+    глубже предела или после пути ?after="""
+    post = get_object_or_404(
+        Post.objects.select_related("author"),
+        author__username=username,
+        id=post_id,
+    )
+    root = get_object_or_404(post.comments, id=comment_id)
+    after = request.GET.get("after")
+    if not (after and after.isalnum() and after.startswith(root.path)):
+        after = None
+    context = {
+        "post": post,
+        "items": threads.expand(post, [root], after, include_roots=False),
+    }
+    response = render(request, "posts/comment_items.html", context)
+    return set_cache_headers(request, response, post_keys(post))
+
+
 @login_required
 def add_comment(request, post_id, username):
     post = get_object_or_404(Post, id=post_id)
@@ -125,22 +278,66 @@ def add_comment(request, post_id, username):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        parent_id = request.POST.get("parent", "")
+        if parent_id.isdigit():
+            comment.parent = post.comments.filter(id=parent_id).first()
+        if comment.parent and comment.parent.depth >= Comment.MAX_DEPTH:
+            comment.parent = comment.parent.parent
         comment.save()
     return redirect("post", username=username, post_id=post_id)
 
 
-@login_required
-def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, 5)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+def _follow_feed(request):
+    paginator = timeline.feed_paginator(request.user, 5)
+    page = paginator.get_page(
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
     context = {
-        "page": page,
-        "paginator": paginator,
+        "paginator": page.paginator,
+        "fragment_url": reverse("follow_index_fragment"),
     }
+    return page, context
+
+
+@login_required
+def follow_index(request):
+    """Возвращает ленту подписок из материализованной ленты пользователя"""
+    return _render_feed(request, "follow.html", *_follow_feed(request))
+
+
+@login_required
+def follow_index_fragment(request):
+    """Возвращает следующую порцию ленты подписок"""
+    return _render_feed(request, FEED_FRAGMENT, *_follow_feed(request))
+
 
-    return render(request, "follow.html", context)
+def _event_stream(request, subscription):
+    last_event_id = request.META.get("HTTP_LAST_EVENT_ID", "")
+    response = StreamingHttpResponse(
+        events.stream(
+            events.broker, subscription,
+            int(last_event_id) if last_event_id.isdigit() else None,
+        ),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # nginx не должен копить поток в буфере
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+def follow_events(request):
+    """Поток уведомлений о новых постах авторов из подписок"""
+    return _event_stream(request, events.Subscription.follow(request.user))
+
+
+@login_required
+def group_events(request, slug: str):
+    """Поток уведомлений о новых постах группы"""
+    group = get_object_or_404(Group, slug=slug)
+    return _event_stream(request, events.Subscription(group_id=group.pk))
 
 
 @login_required
@@ -1,12 +1,48 @@
+from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
+from django.urls import NoReverseMatch, Resolver404, resolve, reverse
 
 
 User = get_user_model()
 
 
+# Адреса страниц пользователя: имя маршрута и аргументы после username
+USER_ROUTES = (
+    ("profile", ()),
+    ("profile_fragment", ()),
+    ("profile_follow", ()),
+    ("profile_unfollow", ()),
+    ("post", (1,)),
+    ("post_edit", (1,)),
+    ("post_comments", (1,)),
+    ("comment_thread", (1, 1)),
+    ("add_comment", (1,)),
+)
+
+
+def is_reserved(username):
+    """Имя занято адресами сайта: какая-то страница пользователя
+    открывала бы не ее, а, например, ленту /posts/, поиск /search/ или
+    группу /group/posts/"""
+    for name, args in USER_ROUTES:
+        try:
+            match = resolve(reverse(name, args=[username, *args]))
+        except (NoReverseMatch, Resolver404):
+            return True
+        if match.url_name != name:
+            return True
+    return False
+
+
 class CreationForm(UserCreationForm):
 
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ("first_name", "last_name", "username", "email")
+
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        if is_reserved(username):
+            raise forms.ValidationError("Это имя пользователя занято")
+        return username
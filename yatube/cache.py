@@ -0,0 +1,329 @@
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS cache_size (total INTEGER NOT NULL);
+INSERT INTO cache_size (total)
+    SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM cache_size);
+CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache
+    BEGIN UPDATE cache_size SET total = total + NEW.size; END;
+CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache
+    BEGIN UPDATE cache_size SET total = total - OLD.size; END;
+CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON cache
+    BEGIN UPDATE cache_size SET total = total + NEW.size - OLD.size; END;
+"""
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite в режиме WAL, общий для всех процессов хоста.
+
+    Читатели не блокируют друг друга и писателя, incr и add атомарны
+    между процессами (BEGIN IMMEDIATE). Общий размер значений ограничен
+    OPTIONS["MAX_SIZE"] байт: при превышении сначала удаляются
+    просроченные записи, затем давно не читанные (LRU). Время чтения
+    обновляется не чаще раза в ACCESS_RESOLUTION секунд, чтобы чтения
+    горячих ключей не превращались в записи."""
+
+    ACCESS_RESOLUTION = 10
+    # При вытеснении освобождаем место с запасом, чтобы не вытеснять
+    # на каждой записи
+    CULL_TO = 0.9
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get("OPTIONS", {})
+        self._max_size = int(options.get("MAX_SIZE", 64 * 1024 * 1024))
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение свое у каждого потока и у каждого процесса после fork
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(
+            self._path, timeout=30, isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        # Без этого INSERT OR REPLACE не вызывает триггер удаления
+        # и общий размер расходится
+        connection.execute("PRAGMA recursive_triggers=ON")
+        connection.executescript(SCHEMA)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _write(self, callback):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = callback(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    @staticmethod
+    def _dumps(value):
+        # Целые храним как есть: так их видно в файле и не нужен pickle
+        if (isinstance(value, int) and not isinstance(value, bool)
+                and -2 ** 63 <= value < 2 ** 63):
+            return value
+        return sqlite3.Binary(
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _loads(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    @staticmethod
+    def _size(stored):
+        return 8 if isinstance(stored, int) else len(stored)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _store(self, connection, key, value, timeout, only_new=False):
+        stored = self._dumps(value)
+        verb = "INSERT OR IGNORE" if only_new else "INSERT OR REPLACE"
+        cursor = connection.execute(
+            f"{verb} INTO cache (key, value, expires, accessed, size) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, stored, self.get_backend_timeout(timeout), time.time(),
+             self._size(stored)),
+        )
+        return cursor.rowcount > 0
+
+    def _total(self, connection):
+        return connection.execute(
+            "SELECT total FROM cache_size").fetchone()[0]
+
+    def _cull(self, connection):
+        if self._total(connection) <= self._max_size:
+            return
+        connection.execute(
+            "DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        excess = self._total(connection) - self._max_size * self.CULL_TO
+        if excess <= 0:
+            return
+        victims = []
+        rows = connection.execute(
+            "SELECT key, size FROM cache ORDER BY accessed")
+        for key, size in rows:
+            victims.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+        rows.close()
+        for start in range(0, len(victims), 500):
+            batch = victims[start:start + 500]
+            connection.execute(
+                f"DELETE FROM cache WHERE key IN "
+                f"({', '.join('?' * len(batch))})", batch,
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+
+        def add(connection):
+            # Просроченная запись не мешает добавлению
+            connection.execute(
+                "DELETE FROM cache WHERE key = ? AND expires <= ?",
+                (key, time.time()))
+            added = self._store(connection, key, value, timeout, True)
+            self._cull(connection)
+            return added
+
+        return self._write(add)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+
+        def store(connection):
+            self._store(connection, key, value, timeout)
+            self._cull(connection)
+
+        self._write(store)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        items = [(self._key(key, version), value)
+                 for key, value in data.items()]
+
+        def store(connection):
+            for key, value in items:
+                self._store(connection, key, value, timeout)
+            self._cull(connection)
+
+        self._write(store)
+        return []
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._get_many([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys_map = {self._key(key, version): key for key in keys}
+        found = self._get_many(list(keys_map))
+        return {keys_map[key]: value for key, value in found.items()}
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ", ".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value, expires, accessed FROM cache "
+            f"WHERE key IN ({placeholders})", keys,
+        ).fetchall()
+        result = {}
+        touched = []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                continue
+            result[key] = self._loads(value)
+            if now - accessed > self.ACCESS_RESOLUTION:
+                touched.append(key)
+        if touched:
+            self._connection().execute(
+                f"UPDATE cache SET accessed = ? WHERE key IN "
+                f"({', '.join('?' * len(touched))})", [now] + touched,
+            )
+        return result
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            "UPDATE cache SET expires = ? "
+            "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+
+        def incr(connection):
+            row = connection.execute(
+                "SELECT value FROM cache WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._loads(row[0]) + delta
+            connection.execute(
+                "UPDATE cache SET value = ? WHERE key = ?",
+                (self._dumps(value), key),
+            )
+            return value
+
+        return self._write(incr)
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return bool(self._connection().execute(
+            "SELECT 1 FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone())
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self._connection().execute(
+                f"DELETE FROM cache WHERE key IN "
+                f"({', '.join('?' * len(keys))})", keys,
+            )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+
+def _sizeof(value):
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(map(_sizeof, value)) + 8 * len(value)
+    return sys.getsizeof(value)
+
+
+class LocalCache:
+    """Кэш в памяти процесса перед общим кэшем. Хранит не больше
+    max_size байт (по оценке _sizeof), при переполнении вытесняет
+    давно не читанные значения. Срока жизни у записей нет: класть сюда
+    стоит значения под неизменяемыми ключами или сбрасывать его целиком"""
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        result = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is not None:
+                    self._data.move_to_end(key)
+                    result[key] = item[0]
+        return result
+
+    def set_many(self, data):
+        with self._lock:
+            for key, value in data.items():
+                size = _sizeof(value)
+                if size > self._max_size:
+                    continue
+                old = self._data.pop(key, None)
+                if old is not None:
+                    self._size -= old[1]
+                self._data[key] = value, size
+                self._size += size
+            while self._size > self._max_size:
+                _, (_, size) = self._data.popitem(last=False)
+                self._size -= size
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                old = self._data.pop(key, None)
+                if old is not None:
+                    self._size -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._data)
@@ -52,6 +52,8 @@ INSTALLED_APPS = (
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'posts.middleware.LocalCacheMiddleware',
+    'posts.middleware.SurrogateCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -136,6 +138,14 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
 MEDIA_URL = '/media/posts/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы называются по хешу содержимого, одинаковые хранятся один раз
+DEFAULT_FILE_STORAGE = 'posts.storage.ContentAddressedStorage'
+# Передача медиафайлов веб-серверу: None - отдает Django,
+# "x-accel-redirect" - nginx, "x-sendfile" - Apache и lighttpd.
+# Для nginx нужен внутренний location:
+#   location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+MEDIA_SENDFILE = None
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
 
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
@@ -143,12 +153,98 @@ LOGIN_REDIRECT_URL = "index"
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
+# Кэш в файле SQLite общий для всех процессов хоста: счетчики поколений
+# и карточки постов видны каждому воркеру без отдельного сервера
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
     }
 }
 
+# Защита от лавины пересчетов (posts/caching.py): значение отдается
+# устаревшим еще CACHE_STALE_TIMEOUT секунд после срока, пока его
+# пересчитывает один процесс под блокировкой на CACHE_LOCK_TIMEOUT секунд.
+# Без устаревшего значения остальные ждут до CACHE_LOCK_WAIT секунд.
+CACHE_STALE_TIMEOUT = 60 * 5
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_WAIT = 5
+# Чем больше, тем раньше значение пересчитывается досрочно (XFetch)
+CACHE_EARLY_RECOMPUTE_BETA = 1.0
+
+# Предел памяти процесса под локальный кэш карточек и счетчиков поколений
+LOCAL_CACHE_MAX_SIZE = 16 * 1024 * 1024
+
+# Страницы лент для анонимов кэшируются под счетчиками поколений, которые
+# увеличиваются при записи, поэтому срок жизни длинный
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Сколько гостевые страницы живут в кэше перед Django (s-maxage). Правки
+# очищают их по суррогатным ключам, поэтому срок может быть долгим
+SURROGATE_CACHE_TIMEOUT = 60 * 60
+
+# Ветки комментариев на странице поста: сколько уровней ответов показывать
+# под комментарием и сколько ответов всего на одну порцию комментариев.
+# Остальное подгружается по ссылкам
+COMMENT_THREAD_DEPTH = 3
+COMMENT_THREAD_REPLIES = 200
+
+# Варианты картинок постов, которые готовятся при загрузке: ширины,
+# пропорция обрезки по центру, форматы (порядок - порядок <source>,
+# последний - запасной для <img>) и качество кодирования
+POST_IMAGE_VARIANTS = {
+    "widths": (320, 640, 960),
+    "aspect": (2, 1),
+    "formats": ("WEBP", "JPEG"),
+    "quality": 80,
+}
+# Пределы загружаемой картинки поста: размер файла и число пикселей,
+# которое проверяется по заголовку до декодирования
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+# Процессов для кодирования картинок, 0 - кодировать в том же процессе
+IMAGE_PROCESSES = 2
+# Потоков фоновой подготовки картинок, 0 - готовить сразу в запросе
+THUMBNAIL_WORKERS = 2
+
+# Карточки постов кэшируются по версии поста, поэтому срок жизни длинный
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Авторы, у которых подписчиков не меньше порога, не раскладывают посты
+# по лентам подписчиков: их посты подмешиваются в ленту при чтении
+TIMELINE_FANOUT_THRESHOLD = 1000
+# Обратно к раскладке автор возвращается, только опустившись ниже этого
+# числа подписчиков, и только при полной перестройке лент
+# (manage.py rebuild_timeline): отписка не пишет в чужие ленты
+TIMELINE_PUSH_THRESHOLD = 800
+
+# Окружение тестов: свой кэш и подготовка картинок в запросе
+TEST_RUNNER = "yatube.testing.TestRunner"
+
+# Число потоков процесса сервера (gunicorn --threads)
+SERVER_THREADS = 8
+
+# Уведомления о новых постах (posts/events.py). Каждое соединение занимает
+# поток сервера (нужен многопоточный воркер, например gunicorn gthread),
+# поэтому потоки поделены: уведомлениям достается не больше четверти, а
+# остальные всегда свободны для обычных страниц. Лишним клиентам
+# предлагается переподключиться через EVENTS_BUSY_RETRY секунд. Поток
+# открывают только авторизованные пользователи. Новые посты других
+# процессов забираются одним запросом раз в EVENTS_POLL_INTERVAL секунд,
+# пустой комментарий уходит раз в EVENTS_HEARTBEAT секунд, а через
+# EVENTS_MAX_AGE секунд клиент переподключается с Last-Event-ID и
+# получает пропущенное, но не больше EVENTS_REPLAY событий
+EVENTS_MAX_CONNECTIONS = max(SERVER_THREADS // 4, 1)
+EVENTS_POLL_INTERVAL = 2
+EVENTS_HEARTBEAT = 15
+EVENTS_MAX_AGE = 5 * 60
+EVENTS_RETRY = 3
+EVENTS_BUSY_RETRY = 30
+EVENTS_REPLAY = 100
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
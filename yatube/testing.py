@@ -0,0 +1,43 @@
+"""Окружение тестов: manage.py test (TestRunner) и pytest (conftest.py
+в корне проекта) включают его одинаково"""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestEnvironment:
+    """Свой файл кэша на запуск тестов: тесты не видят и не стирают кэш
+    разработчика, а следующий запуск начинается с пустого. Картинки
+    готовятся прямо в запросе: фоновые задачи не переживали бы тест, его
+    транзакцию и временный MEDIA_ROOT. Фоновую подготовку тест включает
+    сам через override_settings"""
+
+    def enable(self):
+        self.cache_dir = tempfile.mkdtemp(prefix="yatube-cache-")
+        caches = {
+            alias: dict(config) for alias, config in settings.CACHES.items()
+        }
+        caches["default"]["LOCATION"] = os.path.join(
+            self.cache_dir, "cache.sqlite3")
+        self.override = override_settings(
+            CACHES=caches, THUMBNAIL_WORKERS=0, IMAGE_PROCESSES=0)
+        self.override.enable()
+
+    def disable(self):
+        self.override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.environment = TestEnvironment()
+        self.environment.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.environment.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from yatube.cache import SQLiteCache
+
+
+def make_cache(path, max_size=1024 * 1024):
+    return SQLiteCache(path, {"OPTIONS": {"MAX_SIZE": max_size}})
+
+
+def increment(path, times):
+    cache = make_cache(path)
+    for _ in range(times):
+        cache.incr("counter")
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.sqlite3")
+        self.cache = make_cache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def total_size(self):
+        return self.cache._connection().execute(
+            "SELECT total FROM cache_size").fetchone()[0]
+
+    def test_get_set_and_ttl(self):
+        """Значения читаются до истечения срока и пропадают после"""
+        self.cache.set("key", {"a": 1}, 60)
+        self.cache.set("short", "value", 0.05)
+        self.assertEqual(self.cache.get("key"), {"a": 1})
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get("short"))
+        self.assertTrue(self.cache.add("short", "again"))
+        self.assertFalse(self.cache.add("short", "third"))
+        self.assertEqual(
+            self.cache.get_many(["key", "short", "missing"]),
+            {"key": {"a": 1}, "short": "again"},
+        )
+
+    def test_incr_is_atomic_across_processes(self):
+        """incr из нескольких процессов не теряет инкременты"""
+        self.cache.set("counter", 0, None)
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(target=increment, args=(self.path, 50))
+            for _ in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get("counter"), 150)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_lru_eviction_under_size_cap(self):
+        """При превышении размера вытесняются давно не читанные записи"""
+        cache = make_cache(self.path, max_size=10 * 1024)
+        cache.set("hot", "x" * 1024)
+        for i in range(5):
+            cache.set(f"cold{i}", "x" * 1024)
+        cache._connection().execute(
+            "UPDATE cache SET accessed = accessed - 60")
+        cache.get("hot")
+        for i in range(5, 10):
+            cache.set(f"cold{i}", "x" * 1024)
+        self.assertIsNotNone(cache.get("hot"))
+        self.assertIsNone(cache.get("cold0"))
+        self.assertLessEqual(self.total_size(), 10 * 1024)
+
+    def test_size_accounting_on_replace_and_delete(self):
+        """Общий размер учитывает перезапись и удаление"""
+        self.cache.set("key", "x" * 100)
+        self.cache.set("key", "x" * 10)
+        self.cache.delete("key")
+        self.assertEqual(self.total_size(), 0)
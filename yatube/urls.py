@@ -13,12 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf.urls import handler404, handler500
-from posts import views
+from posts import media, views
 
 handler404 = "posts.views.page_not_found"
 handler500 = "posts.views.server_error"
@@ -29,13 +31,16 @@ urlpatterns = [
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
     path("admin/", admin.site.urls),
+    path("api/v1/", include("posts.api_urls", namespace="api")),
     path("", include("posts.urls")),
     path("about/", include("about.urls", namespace="about")),
+    re_path(
+        r"^%s(?P<path>.+)$" % re.escape(settings.MEDIA_URL.lstrip("/")),
+        media.serve, name="media",
+    ),
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(
         settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 